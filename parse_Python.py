@@ -2,161 +2,439 @@ import ast
 import os
 import sys
 import re
-from typing import List, Dict, Set, Optional, Tuple, Any
-from collections import defaultdict
+import time
+from typing import List, Dict, Set, Optional, Tuple, Any, NamedTuple, Iterable
+from bisect import bisect_right
+from functools import cached_property
+from collections import OrderedDict, defaultdict
 
 
-class CompleteStructureCommenter:
-    #      A more robust Python structure commenter that handles multi-block endings."""
+ENGINES = ("ast", "fast")
+
+
+class StructureObserver:
+    #      Telemetry hooks for CompleteStructureCommenter and generate_VFC.
+    #      Subclass and override what you need; phases are "read", "parse", "collect",
+    #      "apply", "VFC" and "write". Spans are 1-based inclusive (lineno, end_lineno).
+    #      on_file_done fires once the annotated text is ready, before any VFC work.
+    #      With no observer registered none of these are called.
+
+    def on_phase_start(self, phase: str):
+        pass
+
+    def on_phase_end(self, phase: str, seconds: float):
+        pass
+
+    def on_block(self, kind: str, span: Tuple[int, int]):
+        pass
+
+    def on_file_done(self, stats: Dict[str, Any]):
+        pass
+
+
+class StructureContext:
+    #      Per-call state of one annotation. The commenter only holds configuration, so one
+    #      instance can serve many threads; a caller that wants the blocks, metrics or
+    #      annotated lines of a call passes its own context in and reads it afterwards.
+    __slots__ = (
+        "source_lines",
+        "result_lines",
+        "begin_comments",
+        "end_comments",
+        "blocks",
+        "metrics",
+        "filename",
+        "phase_times",
+        "error",
+    )
 
     def __init__(self):
         self.source_lines = []
         self.result_lines = []
         self.begin_comments = {}
         self.end_comments = defaultdict(list)
+        self.blocks = []
+        self.metrics = []
+        self.filename = None
+        self.phase_times = {}
+        self.error = None
+
+    def reset(self):
+        #      Forget the previous call's error, phase times and filename; the parse itself
+        #      replaces the lines, blocks and metrics."""
+        self.filename = None
+        self.phase_times = {}
+        self.error = None
+
 
-    def add_comments(self, filename: str, output_filename: Optional[str] = None) -> str:
+class CompleteStructureCommenter:
+    #      A more robust Python structure commenter that handles multi-block endings.
+    #      engine="ast" parses with ast and falls back to scan_blocks on a SyntaxError;
+    #      engine="fast" always uses scan_blocks (no metrics).
+
+    def __init__(self, observer: Optional[StructureObserver] = None, metrics: bool = False, engine: str = "ast"):
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine {engine!r}; expected one of {', '.join(ENGINES)}")
+
+        self.collect_metrics = metrics
+        self.engine = engine
+        self.observer = observer
+
+    def _phase_start(self, ctx: "StructureContext", phase: str):
+        self.observer.on_phase_start(phase)
+        ctx.phase_times[phase] = time.perf_counter()
+
+    def _phase_end(self, ctx: "StructureContext", phase: str):
+        seconds = time.perf_counter() - ctx.phase_times[phase]
+        ctx.phase_times[phase] = seconds
+        self.observer.on_phase_end(phase, seconds)
+
+    def _file_done(self, ctx: "StructureContext", **extra):
+        stats = {
+            "filename": ctx.filename,
+            "lines": len(ctx.source_lines),
+            "blocks": sum(len(comments) for comments in ctx.begin_comments.values()),
+            "phases": ctx.phase_times,
+        }
+        stats.update(extra)
+        self.observer.on_file_done(stats)
+
+    def add_comments(
+        self, filename: str, output_filename: Optional[str] = None, context: Optional["StructureContext"] = None
+    ) -> str:
         #      Add structural comments to a Python file."""
+        ctx = context if context is not None else StructureContext()
+        ctx.reset()
+        observer = self.observer
+        if observer is not None:
+            ctx.filename = filename
+            self._phase_start(ctx, "read")
+
         with open(filename, "r", encoding="utf-8") as f:
             content = f.read()
 
-        return self.add_comments_to_string(content, output_filename)
+        if observer is not None:
+            self._phase_end(ctx, "read")
 
-    def add_comments_to_string(self, content: str, output_filename: Optional[str] = None) -> str:
-        #      Add structural comments to a Python string."""
-        self.source_lines = content.splitlines()
+        return self._annotate_content(ctx, content, output_filename)
 
-        try:
-            clean_content = re.sub(r"\*([a-zA-Z0-9_]+)\*", r"\1", content)
-            tree = ast.parse(clean_content)
-        except SyntaxError as e:
-            print(f"Syntax error in input file: {e}")
-            # input("enter to continue")
-            return content
+    def add_comments_to_string(
+        self, content: str, output_filename: Optional[str] = None, context: Optional["StructureContext"] = None
+    ) -> str:
+        #      Add structural comments to a Python string. Pass a StructureContext to keep
+        #      the call's blocks and metrics; otherwise nothing outlives the call.
+        ctx = context if context is not None else StructureContext()
+        ctx.reset()
+        return self._annotate_content(ctx, content, output_filename)
 
-        self._collect_comments(tree)
-        self._apply_comments()
-
-        modified_content = "\n".join(self.result_lines)
+    def _annotate_content(self, ctx: "StructureContext", content: str, output_filename: Optional[str]) -> str:
+        observer = self.observer
+        error = self._parse_and_collect(ctx, content)
+        modified_content = self._render(ctx)
 
         if output_filename:
+            if observer is not None:
+                self._phase_start(ctx, "write")
+
             with open(output_filename, "w", encoding="utf-8") as f:
                 f.write(modified_content)
 
+            if observer is not None:
+                self._phase_end(ctx, "write")
+
+        if observer is not None:
+            if error is None:
+                self._file_done(ctx)
+            else:
+                self._file_done(ctx, error=error)
+
+        return modified_content
+
+    def annotate(self, content: str, context: Optional["StructureContext"] = None) -> "AnnotationResult":
+        #      Lazy form of add_comments_to_string: see AnnotationResult."""
+        return AnnotationResult(self, content, context)
+
+    def _parse_and_collect(self, ctx: "StructureContext", content: str) -> Optional[str]:
+        #      Parse content and collect its blocks (and metrics) into ctx; returns the syntax
+        #      error text when the whole-file parse failed and the chunk fallback was used."""
+        observer = self.observer
+        ctx.source_lines = content.splitlines()
+        ctx.metrics = []
+
+        if observer is not None:
+            self._phase_start(ctx, "parse")
+
+        tree = None
+        error = None
+        if self.engine == "ast":
+            try:
+                tree = self._parse(content)
+            except SyntaxError as e:
+                print(f"Syntax error in input file: {e}")
+                # input("enter to continue")
+                error = str(e)
+                ctx.error = error
+
+        if observer is None:
+            self._collect(ctx, tree, content if error is not None else None)
+        else:
+            self._phase_end(ctx, "parse")
+            self._phase_start(ctx, "collect")
+            self._collect(ctx, tree, content if error is not None else None)
+            self._phase_end(ctx, "collect")
+
+        return error
+
+    def _render(self, ctx: "StructureContext") -> str:
+        if self.observer is None:
+            self._apply_comments(ctx)
+            return "\n".join(ctx.result_lines)
+
+        self._phase_start(ctx, "apply")
+        self._apply_comments(ctx)
+        modified_content = "\n".join(ctx.result_lines)
+        self._phase_end(ctx, "apply")
         return modified_content
 
-    def _get_indent(self, line_idx: int) -> str:
+    def collect_blocks(
+        self, content: str, context: Optional["StructureContext"] = None
+    ) -> List[Tuple[int, int, str, Optional[str], bool]]:
+        #      Parse content and return its (lineno, end_lineno, kind, name, has_else) blocks without
+        #      rendering any text. With the AST engine SyntaxError propagates to the caller.
+        ctx = context if context is not None else StructureContext()
+        ctx.reset()
+        ctx.source_lines = content.splitlines()
+        self._collect(ctx, None if self.engine == "fast" else self._parse(content))
+        return ctx.blocks
+
+    def _collect(self, ctx: "StructureContext", tree, failed_content: Optional[str] = None):
+        #      Blocks from the AST when there is one, per top-level statement when the
+        #      whole-file parse failed on failed_content, else from indentation alone.
+        if tree is not None:
+            self._collect_comments(ctx, tree)
+        elif failed_content is not None:
+            self._collect_spans(ctx, self._chunk_spans(ctx, failed_content))
+        else:
+            self._collect_spans(ctx, scan_blocks(ctx.source_lines))
+
+    def _chunk_spans(self, ctx: "StructureContext", content: str) -> List[Tuple[int, int, str, Optional[str], bool]]:
+        #      Parse each top-level statement on its own, so one syntax error only costs the
+        #      statement it sits in; that statement gets indentation-derived blocks instead.
+        from parse_stream import iter_top_level_chunks
+
+        lines = iter(content.splitlines(keepends=True))
+        chunk_commenter = CompleteStructureCommenter(metrics=self.collect_metrics)
+        spans = []
+        offset = 0
+        for chunk in iter_top_level_chunks(lambda: next(lines, "")):
+            chunk_lines = chunk.splitlines()
+            chunk_spans = None
+            if len(chunk) < len(content):
+                chunk_ctx = StructureContext()
+                try:
+                    chunk_spans = chunk_commenter.collect_blocks(chunk, chunk_ctx)
+                except (SyntaxError, ValueError):
+                    pass
+                else:
+                    ctx.metrics += [
+                        row._replace(start=row.start + offset, end=row.end + offset) for row in chunk_ctx.metrics
+                    ]
+
+            if chunk_spans is None:
+                chunk_spans = scan_blocks(chunk_lines)
+
+            for start, end, kind, name, has_else in chunk_spans:
+                spans.append((start + offset, end + offset, kind, name, has_else))
+
+            offset += len(chunk_lines)
+
+        return spans
+
+    def _collect_spans(self, ctx: "StructureContext", spans: Iterable[Tuple[int, int, str, Optional[str], bool]]):
+        ctx.begin_comments = {}
+        ctx.end_comments = defaultdict(list)
+        ctx.blocks = []
+        for start, end, kind, name, has_else in spans:
+            begin_comment, end_comment = BLOCK_MARKERS[kind]
+            ctx.begin_comments.setdefault(start - 1, []).append(begin_comment)
+            ctx.end_comments[end - 1].append((end_comment, self._get_indent(ctx, start - 1), start - 1))
+            ctx.blocks.append((start, end, kind, name, has_else))
+
+            if self.observer is not None:
+                self.observer.on_block(kind, (start, end))
+
+    def _parse(self, content: str):
+        clean_content = re.sub(r"\*([a-zA-Z0-9_]+)\*", r"\1", content)
+        return ast.parse(clean_content)
+
+    def _get_indent(self, ctx: "StructureContext", line_idx: int) -> str:
         #      Get the indentation of a line."""
-        if line_idx < 0 or line_idx >= len(self.source_lines):
+        if line_idx < 0 or line_idx >= len(ctx.source_lines):
             return ""
 
-        line = self.source_lines[line_idx]
+        line = ctx.source_lines[line_idx]
         return line[: len(line) - len(line.lstrip())]
 
-    def _collect_comments_for_node(self, node, node_type, begin_comment, end_comment):
+    def _collect_comments_for_node(self, ctx: "StructureContext", node, node_type, begin_comment, end_comment):
         #      Collect begin and end comments for a specific node."""
         if not hasattr(node, "lineno") or not hasattr(node, "end_lineno"):
             return
 
         start_line = node.lineno - 1
         end_line = node.end_lineno - 1
-        indent = self._get_indent(start_line)
+        indent = self._get_indent(ctx, start_line)
 
-        if start_line not in self.begin_comments:
-            self.begin_comments[start_line] = []
+        if start_line not in ctx.begin_comments:
+            ctx.begin_comments[start_line] = []
 
-        self.begin_comments[start_line].append(begin_comment)
-        self.end_comments[end_line].append((end_comment, indent, start_line))
+        ctx.begin_comments[start_line].append(begin_comment)
+        ctx.end_comments[end_line].append((end_comment, indent, start_line))
+        ctx.blocks.append(
+            (node.lineno, node.end_lineno, node_type, getattr(node, "name", None), self._has_else(ctx, node))
+        )
 
-    def _collect_comments(self, tree):
+        if self.observer is not None:
+            self.observer.on_block(node_type, (node.lineno, node.end_lineno))
+
+    def _has_else(self, ctx: "StructureContext", node) -> bool:
+        #      True when the block ends in an else clause (following elif chains)."""
+        orelse = getattr(node, "orelse", None)
+        while orelse and len(orelse) == 1 and isinstance(orelse[0], ast.If):
+            line_idx = orelse[0].lineno - 1
+            if line_idx >= len(ctx.source_lines) or not ctx.source_lines[line_idx].lstrip().startswith("elif"):
+                break
+
+            orelse = orelse[0].orelse
+
+        return bool(orelse)
+
+    def _is_elif(self, ctx: "StructureContext", node) -> bool:
+        line_idx = node.lineno - 1
+        return line_idx < len(ctx.source_lines) and ctx.source_lines[line_idx].lstrip().startswith("elif")
+
+    def _count_metrics(self, ctx: "StructureContext", node, parent, scope, counts):
+        #      Attribute one node to its innermost function. ast.walk visits parents
+        #      before children, so scope[parent] is always known: (function, depth).
+        function, depth = scope.get(parent, (None, 0))
+
+        if isinstance(node, ast.FunctionDef):
+            kind = "method" if isinstance(parent, ast.ClassDef) else "function"
+            counts[node] = [kind, 0, 0, 0, 1]
+            scope[node] = (node, 0)
+            return
+
+        if isinstance(node, ast.If) and not (isinstance(parent, ast.If) and self._is_elif(ctx, node)):
+            depth += 1
+        elif isinstance(node, METRIC_BLOCK_NODES):
+            depth += 1
+
+        scope[node] = (function, depth)
+        if function is None:
+            return
+
+        row = counts[function]
+        if depth > row[1]:
+            row[1] = depth
+
+        if isinstance(node, (ast.If, ast.IfExp)):
+            row[2] += 1
+            row[4] += 1
+        elif isinstance(node, (ast.For, ast.While)):
+            row[3] += 1
+            row[4] += 1
+        elif isinstance(node, ast.ExceptHandler):
+            row[4] += 1
+        elif isinstance(node, ast.BoolOp):
+            row[4] += len(node.values) - 1
+        elif isinstance(node, ast.comprehension):
+            row[4] += 1 + len(node.ifs)
+        elif MATCH_CASE is not None and isinstance(node, MATCH_CASE):
+            row[4] += 1
+
+    def _collect_comments(self, ctx: "StructureContext", tree):
         #      First pass: collect all the begin/end comments."""
-        self.begin_comments = {}
-        self.end_comments = defaultdict(list)
+        ctx.begin_comments = {}
+        ctx.end_comments = defaultdict(list)
+        ctx.blocks = []
 
         parent_map = {}
         for parent in ast.walk(tree):
             for child in ast.iter_child_nodes(parent):
                 parent_map[child] = parent
 
+        counts = {} if self.collect_metrics else None
+        scope = {}
+
         for node in ast.walk(tree):
+            if counts is not None:
+                self._count_metrics(ctx, node, parent_map.get(node), scope, counts)
 
             if isinstance(node, ast.FunctionDef):
                 parent = parent_map.get(node)
                 if parent and isinstance(parent, ast.ClassDef):
-                    self._collect_comments_for_node(node, "method", "#beginmethod", "#endmethod")
+                    self._collect_comments_for_node(ctx, node, "method", "#beginmethod", "#endmethod")
                 else:
-                    self._collect_comments_for_node(node, "function", "#beginfunc", "#endfunc")
+                    self._collect_comments_for_node(ctx, node, "function", "#beginfunc", "#endfunc")
 
             elif isinstance(node, ast.ClassDef):
-                self._collect_comments_for_node(node, "class", "#beginclass", "#endclass")
+                self._collect_comments_for_node(ctx, node, "class", "#beginclass", "#endclass")
 
             elif isinstance(node, ast.If):
                 start_line = node.lineno - 1
-                if start_line < len(self.source_lines):
-                    line = self.source_lines[start_line].strip()
+                if start_line < len(ctx.source_lines):
+                    line = ctx.source_lines[start_line].strip()
                     if line.startswith("elif"):
                         pass
                         #     self._collect_comments_for_node(
                         #         node, "elif", "#path",  "#endpath"
                         #     )
                     else:
-                        self._collect_comments_for_node(node, "if", "#beginif", "#endif")
+                        self._collect_comments_for_node(ctx, node, "if", "#beginif", "#endif")
 
                 else:
-                    self._collect_comments_for_node(node, "if", "#beginif", "#endif")
+                    self._collect_comments_for_node(ctx, node, "if", "#beginif", "#endif")
 
             elif isinstance(node, ast.For):
-                self._collect_comments_for_node(node, "for", "#beginfor", "#endfor")
+                self._collect_comments_for_node(ctx, node, "for", "#beginfor", "#endfor")
 
             elif isinstance(node, ast.While):
-                self._collect_comments_for_node(node, "while", "#beginwhile", "#endwhile")
+                self._collect_comments_for_node(ctx, node, "while", "#beginwhile", "#endwhile")
 
             elif isinstance(node, ast.With):
-                self._collect_comments_for_node(node, "with", "#beginwith", "#endwith")
+                self._collect_comments_for_node(ctx, node, "with", "#beginwith", "#endwith")
 
             elif isinstance(node, ast.Try):
-                self._collect_comments_for_node(node, "try", "#begintry", "#endtry")
+                self._collect_comments_for_node(ctx, node, "try", "#begintry", "#endtry")
+
+        if counts is not None:
+            ctx.metrics = sorted(
+                (
+                    FunctionMetrics(node.name, kind, node.lineno, node.end_lineno, depth, branches, loops, complexity)
+                    for node, (kind, depth, branches, loops, complexity) in counts.items()
+                ),
+                key=lambda row: row.start,
+            )
 
     def _should_skip_comment(self, line, comment_tag):
         if comment_tag not in line:
             return False
 
-        str_positions = []
-
-        for match in re.finditer(r'"[^"\\]*(?:\\.[^"\\]*)*"', line):
-            str_positions.append((match.start(), match.end()))
+        return bool(find_real_markers(line, re.compile(re.escape(comment_tag))))
 
-        for match in re.finditer(r"'[^'\\]*(?:\\.[^'\\]*)*'", line):
-            str_positions.append((match.start(), match.end()))
+    def _apply_comments(self, ctx: "StructureContext"):
+        ctx.result_lines = []
 
-        for match in re.finditer(re.escape(comment_tag), line):
-            tag_start = match.start()
-            tag_end = match.end()
+        for i, line in enumerate(ctx.source_lines):
 
-            inside_string = False
-            for str_start, str_end in str_positions:
-                if str_start <= tag_start and tag_end <= str_end:
-                    inside_string = True
-                    break
-
-            if not inside_string:
-                return True
-
-        return False
-
-    def _apply_comments(self):
-        self.result_lines = []
+            if i in ctx.begin_comments:
 
-        for i, line in enumerate(self.source_lines):
-
-            if i in self.begin_comments:
-
-                begin_comments = self.begin_comments[i]
+                begin_comments = ctx.begin_comments[i]
                 begin_comment_str = " ".join(begin_comments)
 
                 if "#" in line and not line.strip().startswith("#"):
 
-                    should_skip = any(self._should_skip_comment(line, comment) for comment in begin_comments)  # // //
+                    real_markers = find_real_markers(line) if "#begin" in line else ()
+                    should_skip = any(comment in real_markers for comment in begin_comments)  # // //
                     if should_skip:
 
                         comment_pos = line.find("#")
@@ -164,26 +442,351 @@ class CompleteStructureCommenter:
                         existing_comment = line[comment_pos:]
 
                         modified = f"{code_part} {begin_comment_str} {existing_comment}"
-                        self.result_lines.append(modified)
+                        ctx.result_lines.append(modified)
                     else:
 
-                        self.result_lines.append(f"{line} {begin_comment_str}")
+                        ctx.result_lines.append(f"{line} {begin_comment_str}")
 
                     #     ////////
                 else:
 
-                    self.result_lines.append(f"{line} {begin_comment_str}")
+                    ctx.result_lines.append(f"{line} {begin_comment_str}")
 
             else:
 
-                self.result_lines.append(line)
+                ctx.result_lines.append(line)
 
-            if i in self.end_comments:
+            if i in ctx.end_comments:
 
-                sorted_end_comments = sorted(self.end_comments[i], key=lambda x: x[2], reverse=True)
+                sorted_end_comments = sorted(ctx.end_comments[i], key=lambda x: x[2], reverse=True)
 
                 for end_comment, indent, _ in sorted_end_comments:
-                    self.result_lines.append(f"{indent}{end_comment}")
+                    ctx.result_lines.append(f"{indent}{end_comment}")
+
+
+class AnnotationResult:
+    #      One annotation whose views are computed on first access and kept: blocks and
+    #      metrics need only the parse, annotated renders the marker text, vfc is built
+    #      from annotated, and line_map gives each annotated line's source line number
+    #      (None for inserted #end... lines). The parse runs at most once."""
+
+    def __init__(
+        self, commenter: "CompleteStructureCommenter", source: str, context: Optional["StructureContext"] = None
+    ):
+        self.commenter = commenter
+        self.source = source
+        self.context = context if context is not None else StructureContext()
+        self._collected = False
+
+    def _ctx(self) -> "StructureContext":
+        if not self._collected:
+            self.context.reset()
+            self.commenter._parse_and_collect(self.context, self.source)
+            self._collected = True
+
+        return self.context
+
+    @property
+    def error(self) -> Optional[str]:
+        return self._ctx().error
+
+    @property
+    def blocks(self) -> List[Tuple[int, int, str, Optional[str], bool]]:
+        return self._ctx().blocks
+
+    @property
+    def metrics(self) -> List["FunctionMetrics"]:
+        #      Empty unless the commenter was created with metrics=True (annotate() does that)."""
+        return self._ctx().metrics
+
+    @cached_property
+    def annotated(self) -> str:
+        return self.commenter._render(self._ctx())
+
+    @cached_property
+    def vfc(self) -> str:
+        return generate_VFC(self.annotated, self.commenter.observer)
+
+    @cached_property
+    def line_map(self) -> List[Optional[int]]:
+        ctx = self._ctx()
+        line_map = []
+        for i in range(len(ctx.source_lines)):
+            line_map.append(i + 1)
+            if i in ctx.end_comments:
+                line_map.extend([None] * len(ctx.end_comments[i]))
+
+        return line_map
+
+
+def annotate(
+    content: str, engine: str = "ast", metrics: bool = True, observer: Optional[StructureObserver] = None
+) -> AnnotationResult:
+    #      Annotate a Python string lazily; nothing is parsed until a property is read."""
+    return CompleteStructureCommenter(observer, metrics=metrics, engine=engine).annotate(content)
+
+
+class FunctionMetrics(NamedTuple):
+    #      Per function/method: deepest block nesting inside it, if/elif and conditional
+    #      expression count, for/while count, and McCabe cyclomatic complexity.
+    name: str
+    kind: str
+    start: int
+    end: int
+    max_depth: int
+    branches: int
+    loops: int
+    complexity: int
+
+
+METRIC_BLOCK_NODES = (ast.For, ast.While, ast.With, ast.Try)
+MATCH_CASE = getattr(ast, "match_case", None)
+
+
+class Block(NamedTuple):
+    kind: str
+    name: Optional[str]
+    start: int
+    end: int
+    depth: int
+    parent: int
+    has_else: bool = False
+
+
+class BlockIndex:
+    #      "Where am I" queries over the block spans _collect_comments finds.
+    #      Python block spans nest, so the index is the block tree in start order:
+    #      a bisect finds the last block opened at or before a line, then parent
+    #      links lead out to the enclosing chain, O(log n + depth) per line.
+
+    def __init__(self, spans: Iterable[Tuple[int, int, str, Optional[str], bool]]):
+        ordered = sorted(spans, key=lambda x: (x[0], -x[1]))
+        self.blocks = []
+        stack = []
+        for start, end, kind, name, has_else in ordered:
+            while stack and self.blocks[stack[-1]].end < start:
+                stack.pop()
+
+            parent = stack[-1] if stack else -1
+            self.blocks.append(Block(kind, name, start, end, len(stack), parent, has_else))
+            stack.append(len(self.blocks) - 1)
+
+        self.starts = [block.start for block in self.blocks]
+
+    @classmethod
+    def from_source(cls, content: str) -> "BlockIndex":
+        return cls(CompleteStructureCommenter().collect_blocks(content))
+
+    def _innermost(self, line: int) -> int:
+        i = bisect_right(self.starts, line) - 1
+        while i >= 0 and self.blocks[i].end < line:
+            i = self.blocks[i].parent
+
+        return i
+
+    def enclosing_blocks(self, line: int) -> List[Block]:
+        #      Blocks containing 1-based line, outermost first."""
+        chain = []
+        i = self._innermost(line)
+        while i >= 0:
+            chain.append(self.blocks[i])
+            i = self.blocks[i].parent
+
+        chain.reverse()
+        return chain
+
+    def enclosing_blocks_many(self, lines: Iterable[int]) -> Dict[int, List[Block]]:
+        #      Batch form of enclosing_blocks: one sweep over sorted lines and blocks."""
+        result = {}
+        stack = []
+        i = 0
+        for line in sorted(set(lines)):
+            while i < len(self.blocks) and self.blocks[i].start <= line:
+                while stack and stack[-1].end < self.blocks[i].start:
+                    stack.pop()
+
+                stack.append(self.blocks[i])
+                i += 1
+
+            while stack and stack[-1].end < line:
+                stack.pop()
+
+            result[line] = list(stack)
+
+        return result
+
+
+BLOCK_MARKERS = {
+    "function": ("#beginfunc", "#endfunc"),
+    "method": ("#beginmethod", "#endmethod"),
+    "class": ("#beginclass", "#endclass"),
+    "if": ("#beginif", "#endif"),
+    "for": ("#beginfor", "#endfor"),
+    "while": ("#beginwhile", "#endwhile"),
+    "with": ("#beginwith", "#endwith"),
+    "try": ("#begintry", "#endtry"),
+}
+
+#      Indentation engine tables. A clause keyword continues the open block at its own
+#      indent when that block accepts it; STATEMENT_ONLY words can never appear inside an
+#      expression, so one of them on a line inside unclosed brackets ends the bracket.
+_LINE_START_RE = re.compile(r"(def|class|if|for|while|with|try|elif|else|except|finally)\b(?:[ \t]+(\w+))?")
+_SCAN_RE = re.compile(r"[#'\"()\[\]{}\\]")
+_STRING_END_RE = {quote: re.compile(r"\\.?|" + quote) for quote in ("'", '"', "'''", '"""')}
+_CLAUSES = {"if": ("elif", "else"), "for": ("else",), "while": ("else",), "try": ("except", "else", "finally")}
+_CLAUSE_WORDS = {"elif", "else", "except", "finally"}
+_BLOCK_KEYWORDS = {"def", "class", "if", "for", "while", "with", "try"}
+_HEADER_END_RE = re.compile(r":[ \t]*(?:#.*)?$")
+_STATEMENT_ONLY_RE = re.compile(
+    r"[ \t]*(?:def|class|elif|except|finally|try|while|with|return|import|raise|pass|break|continue|del|global"
+    r"|nonlocal|assert)\b"
+)
+
+
+def _indent_width(line: str, length: int) -> int:
+    return len(line[:length].expandtabs(8))
+
+
+def scan_blocks(lines: List[str]) -> List[Tuple[int, int, str, Optional[str], bool]]:
+    #      The same (lineno, end_lineno, kind, name, has_else) spans as collect_blocks, derived
+    #      in one pass from indentation and leading keywords, with no AST. Strings, brackets
+    #      and backslash continuations are tracked so only logical line starts count. It never
+    #      fails: broken code gives the blocks its indentation implies.
+    spans = []
+    stack = []
+    indent = 0
+    depth = 0
+    quote = None
+    continued = False
+    last_code = 0
+    header = None
+
+    for number, line in enumerate(lines, 1):
+        stripped = line.lstrip(" \t\f")
+        if continued and quote is None and depth > 0 and _bracket_left_open(line, stripped, indent):
+            continued = False
+            depth = 0
+            last_code = number - 1
+
+        if not continued:
+            if not stripped or stripped[0] == "#":
+                continue
+
+            indent = _indent_width(line, len(line) - len(stripped))
+            match = _LINE_START_RE.match(stripped)
+            keyword = match.group(1) if match else None
+            header = (indent, number, keyword, match.group(2) if match else None)
+
+            top = None
+            if keyword in _CLAUSE_WORDS:
+                while stack and stack[-1][0] > indent:
+                    _close_block(stack.pop(), last_code, spans)
+
+                if stack and stack[-1][0] == indent:
+                    kind = stack[-1][1]
+                    if kind is None or keyword in _CLAUSES.get(kind, ()):
+                        top = stack[-1]
+
+            if top is not None:
+                if keyword == "else":
+                    top[4] = True
+                elif keyword == "except" and stripped[6:].lstrip().startswith("*"):
+                    top[1] = None
+                header = None
+            else:
+                while stack and stack[-1][0] >= indent:
+                    _close_block(stack.pop(), last_code, spans)
+
+        quote, depth, comment, backslash = scan_line(line, quote, depth)
+        continued = depth > 0 or quote is not None or backslash
+        if continued:
+            continue
+
+        last_code = number
+        if header is None:
+            continue
+
+        indent, start, keyword, name = header
+        header = None
+        if keyword in _BLOCK_KEYWORDS:
+            if keyword == "def":
+                keyword = "method" if stack and stack[-1][1] == "class" else "function"
+            elif keyword != "class":
+                name = None
+            stack.append([indent, keyword, start, name, False])
+        elif keyword is None and line[:comment].rstrip().endswith(":"):
+            stack.append([indent, None, start, None, False])
+
+    while stack:
+        _close_block(stack.pop(), last_code, spans)
+
+    return spans
+
+
+def scan_line(line: str, quote: Optional[str], depth: int) -> Tuple[Optional[str], int, int, bool]:
+    #      Carry string and bracket state across one physical line. Returns the open
+    #      quote and bracket depth after it, where its comment starts (len(line) if none)
+    #      and whether it ends in a backslash continuation.
+    pos = 0
+    comment = len(line)
+    backslash = False
+    while True:
+        if quote is not None:
+            match = _STRING_END_RE[quote].search(line, pos)
+            if match is None:
+                break
+
+            pos = match.end()
+            if match.group()[0] == "\\":
+                backslash = pos >= len(line)
+            else:
+                quote = None
+            continue
+
+        match = _SCAN_RE.search(line, pos)
+        if match is None:
+            break
+
+        char = match.group()
+        pos = match.end()
+        if char == "#":
+            comment = match.start()
+            break
+
+        if char in "'\"":
+            quote = char * 3 if line.startswith(char * 3, match.start()) else char
+            pos = match.start() + len(quote)
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(depth - 1, 0)
+        else:
+            pos += 1
+            backslash = pos >= len(line)
+
+    if quote in ("'", '"') and not backslash:
+        quote = None
+
+    return quote, depth, comment, backslash
+
+
+def _bracket_left_open(line: str, stripped: str, indent: int) -> bool:
+    #      Inside brackets, a line that can only be a statement, or a block header no deeper
+    #      than the statement that opened the bracket, means the bracket was never closed."""
+    if _STATEMENT_ONLY_RE.match(line):
+        return True
+
+    return (
+        _LINE_START_RE.match(stripped) is not None
+        and _HEADER_END_RE.search(line) is not None
+        and _indent_width(line, len(line) - len(stripped)) <= indent
+    )
+
+
+def _close_block(entry: List, end: int, spans: List):
+    #      Entries with kind None are compound statements the AST engine leaves unmarked."""
+    if entry[1] is not None:
+        spans.append((entry[2], end, entry[1], entry[3], entry[4]))
 
 
 Ends = [
@@ -209,6 +812,59 @@ Begins = [
     "beginfor",
 ]
 
+BEGIN_TAG_RE = re.compile("#(?:" + "|".join(sorted(Begins, key=len, reverse=True)) + ")")
+QUOTE_CHAR_RE = re.compile(r"[\"'\\]")
+
+
+def find_real_markers(line: str, tag_re=BEGIN_TAG_RE) -> Set[str]:
+    #      Tags matched by tag_re that sit outside string literals, in one linear pass
+    #      over the quote and backslash characters.
+    #      A tag counts as quoted when a closed '...' or "..." literal covers it; the
+    #      quote kinds are tracked independently (backslash escapes included), exactly
+    #      like scanning for each kind of literal separately. An unterminated literal
+    #      quotes nothing.
+    occurrences = [(m.start(), m.group()) for m in tag_re.finditer(line)]
+    if not occurrences:
+        return set()
+
+    quoted = [False] * len(occurrences)
+    open_in = {'"': False, "'": False}
+    escaped_at = {'"': -1, "'": -1}
+    pending = {'"': [], "'": []}
+    k = 0
+
+    for match in QUOTE_CHAR_RE.finditer(line):
+        i = match.start()
+        ch = line[i]
+
+        while k < len(occurrences) and occurrences[k][0] < i:
+            for q in ('"', "'"):
+                if open_in[q]:
+                    pending[q].append(k)
+
+            k += 1
+
+        for q in ('"', "'"):
+            if not open_in[q]:
+                if ch == q:
+                    open_in[q] = True
+
+            elif escaped_at[q] == i:
+                pass
+
+            elif ch == "\\":
+                escaped_at[q] = i + 1
+
+            elif ch == q:
+                for j in pending[q]:
+                    quoted[j] = True
+
+                open_in[q] = False
+                pending[q] = []
+
+    return {tag for (_, tag), inside in zip(occurrences, quoted) if not inside}
+
+
 begin_type = {
     "beginfunc": "input",
     "beginmethod": "input",
@@ -248,6 +904,106 @@ output_type = [
 ]
 VFCSEPERATOR = ";//"
 
+LINE_BLANK = 0
+LINE_COMMENT = 1
+LINE_CODE = 2
+
+#      One match per "\n"-separated line: leading whitespace, the is_path head (looked
+#      ahead, up to space, tab, '(', ':' or '#'), a leading '#', the first word (up to
+#      whitespace or '#') and the first '#' anywhere on the line.
+_LINE_TABLE_RE = re.compile(r"^([^\S\n]*)(?=([^ \t(:#\n]*))(#?)([^\s#]*)[^\n#]*(#?)[^\n]*$", re.MULTILINE)
+_ASCII_SPACE = b" \t\x0b\x0c\r\x1c\x1d\x1e\x1f"
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+
+    return numpy
+
+
+class LineTable:
+    #      Per-line facts for a whole buffer, split on "\n" like generate_VFC, kept as
+    #      parallel columns: indents (leading whitespace length), kinds (LINE_BLANK,
+    #      LINE_COMMENT, LINE_CODE), words (first word, as get_VFC_type sees it), heads
+    #      (is_path token) and hashes (column of the first '#', -1 if none). Built in
+    #      one regex pass; use_numpy=True derives the same columns with NumPy over the
+    #      bytes of an ASCII buffer (no faster while the string columns are built per line)."""
+
+    __slots__ = ("starts", "indents", "kinds", "words", "heads", "hashes")
+
+    def __init__(self, text: str, use_numpy: bool = False):
+        if use_numpy and text.isascii() and _numpy() is not None:
+            self._scan_numpy(text)
+        else:
+            self._scan_regex(text)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _scan_regex(self, text: str):
+        starts = self.starts = []
+        indents = self.indents = []
+        kinds = self.kinds = []
+        words = self.words = []
+        heads = self.heads = []
+        hashes = self.hashes = []
+        for match in _LINE_TABLE_RE.finditer(text):
+            start = match.start()
+            body = match.end(1)
+            _, head, lead, word, hash_mark = match.groups()
+            starts.append(start)
+            indents.append(body - start)
+            heads.append(head.rstrip())
+            if lead:
+                words.append("")
+                kinds.append(LINE_COMMENT)
+                hashes.append(body - start)
+            else:
+                words.append(word)
+                kinds.append(LINE_CODE if word else LINE_BLANK)
+                hashes.append(match.start(5) - start if hash_mark else -1)
+
+    def _scan_numpy(self, text: str):
+        np = _numpy()
+        data = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+        size = len(data)
+        newlines = np.flatnonzero(data == 10)
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.append(newlines, size)
+
+        space = np.zeros(256, dtype=bool)
+        space[list(_ASCII_SPACE)] = True
+        first = starts.copy()
+        active = np.flatnonzero(first < ends)
+        while len(active):
+            active = active[space[data[first[active]]]]
+            first[active] += 1
+            active = active[first[active] < ends[active]]
+
+        def first_after(positions, stops):
+            positions = np.append(np.flatnonzero(positions), size)
+            return positions[np.searchsorted(positions, stops)]
+
+        padded = np.append(data, 0)
+        blank = first == ends
+        comment = ~blank & (padded[first] == 35)
+        word_end = first_after(space[data] | (data == 10) | (data == 35), first)
+        stop = np.zeros(256, dtype=bool)
+        stop[list(b" \t(:#\n")] = True
+        head_end = first_after(stop[data], first)
+        hash_at = first_after(data == 35, starts)
+
+        self.starts = starts.tolist()
+        self.indents = (first - starts).tolist()
+        self.kinds = np.where(blank, LINE_BLANK, np.where(comment, LINE_COMMENT, LINE_CODE)).tolist()
+        self.hashes = np.where(hash_at < ends, hash_at - starts, -1).tolist()
+        first = first.tolist()
+        self.words = [text[a:b] for a, b in zip(first, word_end.tolist())]
+        self.heads = [text[a:b].rstrip() for a, b in zip(first, head_end.tolist())]
+
 
 #     def is_path(line: str) -> bool:
 #         parts = line.strip().split(None, 1)
@@ -370,14 +1126,18 @@ def has_colon_outside_literals(code):  # ////
 
 def get_VFC_type(code: str, comment: str) -> Optional[str]:
     token = code.strip().split(None, 1)[0] if len(code) > 1 else "none"
+    return _get_VFC_type(code, comment, token, is_path(code))
+
 
+def _get_VFC_type(code: str, comment: str, token: str, path: bool) -> Optional[str]:
+    #      get_VFC_type with the first word and is_path result already known (from a LineTable)."""
     if token in event_type:
         return "event"
 
     if code.startswith("@"):
         return "input"
 
-    if is_path(code) and has_colon_outside_literals(code):
+    if path and has_colon_outside_literals(code):
         return "path"
 
     if re.match(r"^\s*else\s*:", code):
@@ -430,16 +1190,113 @@ STRUCT_COMMENT_LINES = {
 }
 
 
-def generate_VFC(input_string):
+PARALLEL_VFC_LINES = 200_000
+
+
+class VFCLineCache:
+    #      Bounded LRU memo of VFC records for code lines, keyed on the exact line without
+    #      its indentation. That text fixes the (code, comment) split and so the VFC type,
+    #      so repeated lines (else:, return, pass, except Exception as e:) are classified
+    #      once. generate_VFC uses a fresh cache per call unless one is passed in to share
+    #      across files."""
+
+    def __init__(self, maxsize: int = 8192):
+        self.maxsize = maxsize
+        self.records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def store(self, key: str, record: str):
+        self.misses += 1
+        if self.maxsize <= 0:
+            return
+
+        if len(self.records) >= self.maxsize:
+            self.records.popitem(last=False)
+
+        self.records[key] = record
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.records),
+            "maxsize": self.maxsize,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self.records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+def generate_VFC(
+    input_string,
+    observer: Optional[StructureObserver] = None,
+    cache: Optional[VFCLineCache] = None,
+    jobs: int = 1,
+):
+    #      jobs > 1 splits inputs of PARALLEL_VFC_LINES lines or more across worker
+    #      processes (each with its own cache); the output is the same either way."""
+    if observer is None:
+        return _generate_VFC_jobs(input_string, cache, jobs)
+
+    observer.on_phase_start("VFC")
+    start = time.perf_counter()
+    VFC = _generate_VFC_jobs(input_string, cache, jobs)
+    observer.on_phase_end("VFC", time.perf_counter() - start)
+
+    return VFC
+
+
+def _generate_VFC_jobs(input_string, cache: Optional[VFCLineCache], jobs: int):
+    if jobs <= 1 or input_string.count("\n") + 1 < PARALLEL_VFC_LINES:
+        return _generate_VFC(input_string, cache)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return "".join(executor.map(_generate_VFC, split_line_chunks(input_string, jobs * 2)))
+
+
+def split_line_chunks(text: str, count: int) -> List[str]:
+    #      Cut text at "\n" boundaries into about count pieces of similar length. Each VFC
+    #      record depends only on its own line, so the pieces' VFC joined in order is the
+    #      VFC of text."""
+    chunks = []
+    prev = 0
+    for k in range(1, count):
+        cut = text.find("\n", max(len(text) * k // count, prev))
+        if cut < 0:
+            break
+
+        chunks.append(text[prev:cut])
+        prev = cut + 1
+
+    chunks.append(text[prev:])
+    return chunks
+
+
+def _generate_VFC(input_string, cache: Optional[VFCLineCache] = None):
+    if cache is None:
+        cache = VFCLineCache()
+
     strings = input_string.split("\n")
+    table = LineTable(input_string)
+    indents, kinds, words, heads, hashes = table.indents, table.kinds, table.words, table.heads, table.hashes
+    records = cache.records
+    misses = cache.misses
+    code_lines = 0
     VFC = ""
-    for string in strings:
+    for i, string in enumerate(strings):
 
-        if not string.strip():
+        if kinds[i] == LINE_BLANK:
             VFC += f"generic(){VFCSEPERATOR}\n"
             continue
 
-        stripped = string.lstrip()
+        stripped = string[indents[i] :]
 
         #      Comment-only structural marker lines: treat like old structure
         if stripped in STRUCT_COMMENT_LINES:
@@ -465,7 +1322,7 @@ def generate_VFC(input_string):
             continue
 
         #      Non-struct comment-only lines  set(#)
-        if stripped.startswith("#"):
+        if kinds[i] == LINE_COMMENT:
             if len(stripped.rstrip()) == 1:
                 VFC += f"set(#){VFCSEPERATOR}{stripped[1:]}\n"
             else:
@@ -473,71 +1330,293 @@ def generate_VFC(input_string):
 
             continue
 
-        code, comment = split_string(string)
-        code = code.strip()
-        vtype = get_VFC_type(code, comment)
+        code_lines += 1
+        record = records.get(stripped)
+        if record is None:
+            record = _code_line_VFC(stripped, words[i], heads[i], hashes[i] >= 0)
+            cache.store(stripped, record)
+        else:
+            records.move_to_end(stripped)
+
+        VFC += record
+
+    cache.hits += code_lines - (cache.misses - misses)
+    return VFC
+
+
+def _code_line_VFC(line: str, word: str, head: str, has_hash: bool) -> str:
+    #      VFC record(s) for one code line given without its indentation; word, head and
+    #      has_hash come from the line's LineTable row."""
+    code, comment = split_string(line) if has_hash else (line.rstrip(), "")
+    code = code.strip()
+    vtype = _get_VFC_type(code, comment, word if len(code) > 1 else "none", head in path_type)
+
+    c = comment.lstrip()
+    if c.startswith("#"):
+        c_no_hash = c[1:].lstrip()
+    else:
+        c_no_hash = c
 
-        c = comment.lstrip()
+    marker = get_marker(c_no_hash)
+    is_struct = marker in Begins or marker in Ends
+
+    if is_struct:
+        if c_no_hash.startswith(marker):
+            tail = c_no_hash[len(marker) :].lstrip()
+        else:
+            tail = c_no_hash
+
+        out_comment = tail
+    else:
         if c.startswith("#"):
-            c_no_hash = c[1:].lstrip()
+            out_comment = c[1:].lstrip()
         else:
-            c_no_hash = c
+            out_comment = comment.strip()
 
-        marker = get_marker(c_no_hash)
-        is_struct = marker in Begins or marker in Ends
+    record = ""
+    if is_struct and marker == "endclass":
+        record += f"bend(){VFCSEPERATOR}\n"
 
-        if is_struct:
-            if c_no_hash.startswith(marker):
-                tail = c_no_hash[len(marker) :].lstrip()
-            else:
-                tail = c_no_hash
+    record += f"{vtype}({code}){VFCSEPERATOR} {out_comment}\n"
 
-            out_comment = tail
-        else:
-            if c.startswith("#"):
-                out_comment = c[1:].lstrip()
-            else:
-                out_comment = comment.strip()
+    if vtype == "branch":
+        record += f"path(){VFCSEPERATOR}\n"
+
+    if is_struct and marker == "beginclass":
+        record += f"branch(){VFCSEPERATOR}\n"
+        record += f"path(){VFCSEPERATOR}\n"
+        record += f"path(){VFCSEPERATOR}\n"
 
-        if is_struct and marker == "endclass":
-            VFC += f"bend(){VFCSEPERATOR}\n"
+    return record
 
-        VFC += f"{vtype}({code}){VFCSEPERATOR} {out_comment}\n"
 
-        if vtype == "branch":
-            VFC += f"path(){VFCSEPERATOR}\n"
+def VFC_footer(target_file: str) -> str:
+    #      Session trailer VFCode expects at the end of a .vfc file."""
+    footer = ";INSE" + "CTA EMBEDDED SESSION INFORMATION\n"
+    footer += "; 255 16777215 65280 16777088 16711680 13158600 8388863 0 255 255 8454143 6946660 3684381\n"
+    footer += f";    {target_file}   #   .\n"
+    footer += "; notepad.exe\n"
+    footer += ";INSE" + "CTA EMBEDDED ALTSESSION INFORMATION\n; 260 260 1121 964 0 130   569   58    python.key  0"
+    return footer
 
-        if is_struct and marker == "beginclass":
-            VFC += f"branch(){VFCSEPERATOR}\n"
-            VFC += f"path(){VFCSEPERATOR}\n"
-            VFC += f"path(){VFCSEPERATOR}\n"
 
-    return VFC
+def write_VFC_file(
+    input_file: str, VFC: str, only_if_changed: bool = False, observer: Optional[StructureObserver] = None
+) -> Optional[str]:
+    #      Write <input_file>.vfc next to the source and return its path.
+    #      With only_if_changed an identical existing file is left alone and None is returned.
+    target_file = os.path.basename(input_file)
+    vfc_filename = input_file + ".vfc"
+    data = VFC + VFC_footer(target_file)
+
+    if observer is not None:
+        observer.on_phase_start("write")
+        start = time.perf_counter()
+
+    if only_if_changed:
+        try:
+            with open(vfc_filename, "r", encoding="ascii", errors="ignore") as f:
+                if f.read() == data.encode("ascii", errors="ignore").decode("ascii"):
+                    if observer is not None:
+                        observer.on_phase_end("write", time.perf_counter() - start)
+                    return None
+        except OSError:
+            pass
+
+    with open(vfc_filename, "w", encoding="ascii", errors="ignore") as VFC_output:
+
+        VFC_output.write(data)
+
+    if observer is not None:
+        observer.on_phase_end("write", time.perf_counter() - start)
+
+    return vfc_filename
+
+
+def write_metrics_report(path: str, rows: Iterable[Tuple[str, FunctionMetrics]]):
+    #      Write (filename, FunctionMetrics) rows as JSON when path ends in .json, else CSV."""
+    fields = ["file"] + list(FunctionMetrics._fields)
+    records = [[filename] + list(row) for filename, row in rows]
+
+    if path.endswith(".json"):
+        import json
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([dict(zip(fields, record)) for record in records], f, indent=1)
+
+        return
+
+    import csv
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        writer.writerows(records)
 
 
 def main():
     import argparse
+    import contextlib
 
     parser = argparse.ArgumentParser(description="Add structure comments to Python code")
-    parser.add_argument("input_file", help="Input Python file")
-    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("input_file", nargs="*", help="Input Python file(s)")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout, single input only)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="Workers for multi-file runs, or for the VFC of one large file"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("auto", "processes", "threads", "subinterpreters"),
+        default="auto",
+        help="Multi-file workers: processes, threads, subinterpreters (experimental), or auto"
+        " (threads when the GIL is disabled)",
+    )
+    parser.add_argument(
+        "--order",
+        choices=("largest", "given"),
+        default="largest",
+        help="Multi-file dispatch order: largest-first with small files chunked, or input order",
+    )
+    parser.add_argument("--watch", metavar="DIR", help="Re-annotate .py files under DIR whenever they are saved")
+    parser.add_argument("--poll", action="store_true", help="With --watch, poll instead of using inotify")
+    parser.add_argument(
+        "--since", metavar="REF", help="Annotate only Python files changed since a git ref, plus untracked ones"
+    )
+    parser.add_argument(
+        "--staged", action="store_true", help="Annotate only Python files staged in git (untracked files are not)"
+    )
+    parser.add_argument(
+        "--stream", action="store_true", help="Process one top-level statement at a time (bounded memory)"
+    )
+    parser.add_argument(
+        "--memprofile", action="store_true", help="Report tracemalloc peak and top allocation sites per phase"
+    )
+    parser.add_argument(
+        "--strip",
+        action="store_true",
+        help="Remove structure markers instead: one file to stdout/-o, several files or directories in place",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="ast",
+        help="Block detection: ast (falls back to indentation on syntax errors) or fast (indentation only)",
+    )
+    parser.add_argument(
+        "--metrics", metavar="FILE", help="Write per-function complexity metrics to FILE (.json, otherwise CSV)"
+    )
     args = parser.parse_args()
-    commenter = CompleteStructureCommenter()
-    modified_code = commenter.add_comments(args.input_file, args.output)
-    VFC = generate_VFC(modified_code)
-    target_file = os.path.basename(args.input_file)
 
-    print(VFC)
+    if args.metrics and args.engine == "fast":
+        parser.error("--metrics needs the ast engine; --engine fast computes no metrics")
+
+    if args.since or args.staged:
+        import parse_git
+
+        options = (
+            ("input files", args.input_file),
+            ("-o/--output", args.output),
+            ("--metrics", args.metrics),
+            ("--stream", args.stream),
+            ("--memprofile", args.memprofile),
+            ("--strip", args.strip),
+            ("--watch", args.watch),
+        )
+        rejected = [name for name, value in options if value]
+        if rejected:
+            parser.error(f"{', '.join(rejected)} cannot be combined with --since/--staged")
+
+        parse_git.sync_changed(
+            since=args.since,
+            staged=args.staged,
+            jobs=args.jobs,
+            engine=args.engine,
+            backend=args.backend,
+            order=args.order,
+        )
+        return None
+
+    if args.watch:
+        import parse_watch
+
+        if args.backend != "auto":
+            parser.error("--backend does not apply to --watch, which re-annotates one file at a time")
+
+        parse_watch.watch(args.watch, polling=args.poll, engine=args.engine)
+        return None
+
+    if not args.input_file:
+        parser.error("an input file (or --watch DIR) is required")
+
+    if args.strip:
+        import parse_strip
+
+        if len(args.input_file) == 1 and os.path.isfile(args.input_file[0]):
+            with contextlib.ExitStack() as stack:
+                src = stack.enter_context(open(args.input_file[0], "r", encoding="utf-8", newline=""))
+                out = sys.stdout
+                if args.output:
+                    out = stack.enter_context(open(args.output, "w", encoding="utf-8", newline=""))
+                parse_strip.strip_stream(src, out)
+            return None
+
+        if args.output:
+            parser.error("-o/--output needs a single input file")
+
+        parse_strip.strip_paths(args.input_file, jobs=args.jobs)
+        return None
+
+    if len(args.input_file) > 1:
+        if args.output:
+            parser.error("-o/--output needs a single input file")
+
+        import parse_multi
+
+        stats = parse_multi.annotate_files(
+            args.input_file,
+            jobs=args.jobs,
+            order=args.order,
+            metrics=bool(args.metrics),
+            engine=args.engine,
+            backend=args.backend,
+        )
+        if args.metrics:
+            write_metrics_report(args.metrics, stats["metrics"])
+
+        return None
+
+    input_file = args.input_file[0]
+    if args.stream and args.metrics:
+        parser.error("--metrics is not available with --stream")
+
+    if args.stream:
+        import parse_stream
+
+        commenter = CompleteStructureCommenter(engine=args.engine)
+        parse_stream.stream_annotate(input_file, args.output, echo=sys.stdout, commenter=commenter)
+        return None
+
+    observer = None
+    if args.memprofile:
+        import parse_profile
+
+        observer = parse_profile.MemoryProfiler()
+
+    commenter = CompleteStructureCommenter(observer, metrics=bool(args.metrics), engine=args.engine)
+    context = StructureContext()
+    modified_code = commenter.add_comments(input_file, args.output, context)
+    if args.metrics:
+        write_metrics_report(args.metrics, ((input_file, row) for row in context.metrics))
+
+    VFC = generate_VFC(modified_code, observer, jobs=args.jobs or 1)
 
-    footer = ";INSE" + "CTA EMBEDDED SESSION INFORMATION\n"
-    footer += "; 255 16777215 65280 16777088 16711680 13158600 8388863 0 255 255 8454143 6946660 3684381\n"
-    footer += f";    {target_file}   #   .\n"
-    footer += "; notepad.exe\n"
-    footer += ";INSE" + "CTA EMBEDDED ALTSESSION INFORMATION\n; 260 260 1121 964 0 130   569   58    python.key  0"
+    print(VFC)
 
-    with open(args.input_file + ".vfc", "w", encoding="ascii", errors="ignore") as VFC_output:
+    write_VFC_file(input_file, VFC, observer=observer)
 
-        VFC_output.write(VFC + footer)
+    if observer is not None:
+        observer.stop()
+        observer.report()
 
     return modified_code
 
@@ -0,0 +1,457 @@
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+from typing import Any, Dict, List, Optional
+
+from parse_Python import (
+    CompleteStructureCommenter,
+    StructureObserver,
+    VFCLineCache,
+    generate_VFC,
+    find_real_markers,
+    scan_blocks,
+)
+import parse_corpus
+
+BASELINE_DIR = ".bench"
+DEFAULT_SIZES = "1000,10000,50000"
+PHASES = ["parse", "collect", "apply", "VFC"]
+
+
+class PhaseTimer(StructureObserver):
+    def __init__(self):
+        self.times = {}
+
+    def on_phase_end(self, phase: str, seconds: float):
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+    }
+
+
+def run_benchmark(sizes: List[int], repeats: int = 5, seed: int = 0) -> Dict[str, Any]:
+    #      Per-phase samples (seconds) for each corpus size; the corpus is regenerated
+    #      from the seed so every machine times the same input.
+    results = {}
+    for size in sizes:
+        source = parse_corpus.generate_module(seed, size)
+        samples = {phase: [] for phase in PHASES + ["total"]}
+
+        for _ in range(repeats):
+            timer = PhaseTimer()
+            commenter = CompleteStructureCommenter(timer)
+            start = time.perf_counter()
+            generate_VFC(commenter.add_comments_to_string(source), timer)
+            samples["total"].append(time.perf_counter() - start)
+            for phase in PHASES:
+                samples[phase].append(timer.times.get(phase, 0.0))
+
+        results[str(size)] = samples
+
+    return {"machine": machine_info(), "seed": seed, "repeats": repeats, "results": results}
+
+
+def _noise(values: List[float]) -> float:
+    #      Scaled median absolute deviation: a robust stand-in for the standard deviation."""
+    median = statistics.median(values)
+    return 1.4826 * statistics.median(abs(v - median) for v in values)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10) -> List[Dict[str, Any]]:
+    #      One row per (size, phase) present in both runs. A stage regresses when its
+    #      median slowed down by more than threshold and by more than 3x the noise.
+    rows = []
+    for size, base_samples in baseline["results"].items():
+        new_samples = current["results"].get(size)
+        if new_samples is None:
+            continue
+
+        for phase, base_values in base_samples.items():
+            new_values = new_samples.get(phase)
+            if not new_values:
+                continue
+
+            base_median = statistics.median(base_values)
+            new_median = statistics.median(new_values)
+            noise = max(_noise(base_values), _noise(new_values))
+            delta = new_median - base_median
+            ratio = new_median / base_median if base_median > 0 else 1.0
+
+            rows.append(
+                {
+                    "size": size,
+                    "phase": phase,
+                    "baseline": base_median,
+                    "current": new_median,
+                    "ratio": ratio,
+                    "regressed": ratio > 1.0 + threshold and delta > 3 * noise,
+                }
+            )
+
+    return rows
+
+
+def baseline_path(name: str, directory: str = BASELINE_DIR) -> str:
+    return os.path.join(directory, f"{name}.json")
+
+
+def save_baseline(name: str, run: Dict[str, Any], directory: str = BASELINE_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = baseline_path(name, directory)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=1)
+
+    return path
+
+
+def load_baseline(name: str, directory: str = BASELINE_DIR) -> Dict[str, Any]:
+    with open(baseline_path(name, directory), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_rows(rows: List[Dict[str, Any]], out: Any = sys.stdout):
+    out.write(f"{'size':>8} {'phase':<8} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}\n")
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        out.write(
+            f"{row['size']:>8} {row['phase']:<8} {row['baseline'] * 1000:12.2f} {row['current'] * 1000:12.2f}"
+            f" {row['ratio']:7.2f}{flag}\n"
+        )
+
+
+def marker_scaling(items: List[int], repeats: int = 5, seed: int = 0) -> List[Dict[str, Any]]:
+    #      Time find_real_markers on single lines holding n string literals and markers."""
+    import random
+
+    rng = random.Random(seed)
+    rows = []
+    for n in items:
+        line = parse_corpus.gen_string_heavy_line(rng, n)[0]
+        best = min(_time_call(find_real_markers, line) for _ in range(repeats))
+        rows.append({"items": n, "chars": len(line), "seconds": best, "ns_per_char": best * 1e9 / len(line)})
+
+    return rows
+
+
+def compare_engines(sources: List[str], repeats: int = 3) -> Dict[str, Any]:
+    #      Block-collection throughput of the AST and indentation engines on the same
+    #      sources, and how often they agree. Sources the AST engine rejects are skipped.
+    lines = 0
+    ast_seconds = 0.0
+    fast_seconds = 0.0
+    same_files = 0
+    shared = 0
+    union = 0
+    checked = 0
+    for source in sources:
+        commenter = CompleteStructureCommenter()
+        try:
+            ast_spans = set(commenter.collect_blocks(source))
+        except (SyntaxError, ValueError):
+            continue
+
+        source_lines = source.splitlines()
+        ast_seconds += min(_time_call(commenter.collect_blocks, source) for _ in range(repeats))
+        fast_seconds += min(_time_call(scan_blocks, source_lines) for _ in range(repeats))
+        fast_spans = set(scan_blocks(source_lines))
+
+        checked += 1
+        lines += len(source_lines)
+        same_files += ast_spans == fast_spans
+        shared += len(ast_spans & fast_spans)
+        union += len(ast_spans | fast_spans)
+
+    return {
+        "files": checked,
+        "lines": lines,
+        "ast_lines_per_sec": lines / ast_seconds if ast_seconds > 0 else 0.0,
+        "fast_lines_per_sec": lines / fast_seconds if fast_seconds > 0 else 0.0,
+        "files_identical": same_files / checked if checked else 1.0,
+        "span_agreement": shared / union if union else 1.0,
+    }
+
+
+def backend_scaling(
+    backends: List[str], workers: List[int], files: int = 64, lines: int = 2000, seed: int = 0
+) -> List[Dict[str, Any]]:
+    #      Annotate the same generated multi-file corpus with each backend and worker count.
+    #      Speedup is against the same backend with one worker.
+    import tempfile
+    import parse_multi
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="pyparse-bench-") as tmp:
+        paths = [
+            parse_corpus.write_corpus(os.path.join(tmp, str(i)), [lines], seed + i)[0] for i in range(files)
+        ]
+        for backend in backends:
+            single = None
+            for jobs in workers:
+                stats = parse_multi.annotate_files(paths, jobs=jobs, progress=None, backend=backend)
+                single = single or stats["seconds"]
+                rows.append(
+                    {
+                        "backend": stats["backend"],
+                        "jobs": jobs,
+                        "seconds": stats["seconds"],
+                        "lines_per_sec": stats["lines_per_sec"],
+                        "speedup": single / stats["seconds"] if stats["seconds"] > 0 else 0.0,
+                    }
+                )
+
+    return rows
+
+
+def compare_VFC_cache(sources: List[str], repeats: int = 3, maxsize: int = 8192) -> Dict[str, Any]:
+    #      VFC generation over the annotated sources with one line cache shared by all of
+    #      them, against the same run with caching disabled (maxsize 0)."""
+    commenter = CompleteStructureCommenter(engine="fast")
+    annotated = [commenter.add_comments_to_string(source) for source in sources]
+
+    def run(size):
+        cache = VFCLineCache(size)
+        start = time.perf_counter()
+        for text in annotated:
+            generate_VFC(text, cache=cache)
+        return time.perf_counter() - start, cache
+
+    cached_seconds, cache = min((run(maxsize) for _ in range(repeats)), key=lambda x: x[0])
+    plain_seconds = min(run(0)[0] for _ in range(repeats))
+    return {
+        "files": len(sources),
+        "lines": sum(text.count("\n") + 1 for text in annotated),
+        "cached_seconds": cached_seconds,
+        "plain_seconds": plain_seconds,
+        "speedup": plain_seconds / cached_seconds if cached_seconds > 0 else 0.0,
+        "cache": cache.stats(),
+    }
+
+
+def VFC_scaling(workers: List[int], lines: int = 1_000_000, seed: int = 0) -> List[Dict[str, Any]]:
+    #      generate_VFC on one annotated input of the given line count (a generated module,
+    #      annotated once and repeated) for each worker count; every output is checked
+    #      against the single-process one."""
+    unit = CompleteStructureCommenter(engine="fast").add_comments_to_string(
+        parse_corpus.generate_module(seed, min(lines, 50_000))
+    )
+    unit_lines = unit.split("\n")
+    text = "\n".join((unit_lines * (lines // len(unit_lines) + 1))[:lines])
+
+    rows = []
+    expected = None
+    single = None
+    for jobs in workers:
+        start = time.perf_counter()
+        VFC = generate_VFC(text, jobs=jobs)
+        seconds = time.perf_counter() - start
+        if expected is None:
+            expected = generate_VFC(text) if jobs != 1 else VFC
+
+        single = single or seconds
+        rows.append(
+            {
+                "jobs": jobs,
+                "lines": lines,
+                "seconds": seconds,
+                "speedup": single / seconds if seconds > 0 else 0.0,
+                "identical": VFC == expected,
+            }
+        )
+
+    return rows
+
+
+def _read_sources(paths: List[str]) -> List[str]:
+    from parse_index import iter_python_files
+
+    sources = []
+    for path in iter_python_files(paths):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            sources.append(f.read())
+
+    return sources
+
+
+def _time_call(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the parser against a saved baseline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for command, text in (("save", "Run and store a named baseline"), ("compare", "Run and compare to a baseline")):
+        cmd = sub.add_parser(command, help=text)
+        cmd.add_argument("name", help="Baseline name")
+        if command == "save":
+            cmd.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated corpus line counts")
+            cmd.add_argument("--repeats", type=int, default=5)
+        else:
+            cmd.add_argument("--sizes", help="Comma-separated corpus line counts (default: the baseline's)")
+            cmd.add_argument("--repeats", type=int, help="Runs per size (default: the baseline's)")
+
+        cmd.add_argument("--seed", type=int, default=0)
+        cmd.add_argument("--dir", default=BASELINE_DIR, help="Where baselines are kept")
+        if command == "compare":
+            cmd.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown (0.10 = 10%%)")
+
+    cmd = sub.add_parser("scaling", help="Check that marker detection grows linearly with line length")
+    cmd.add_argument("--items", default="1000,4000,16000,64000", help="String literals per line")
+    cmd.add_argument("--max-growth", type=float, default=2.0, help="Allowed growth of time per character")
+
+    cmd = sub.add_parser("engines", help="Compare the AST and indentation engines: throughput and agreement")
+    cmd.add_argument("paths", nargs="*", help="Files or directories (default: generated corpora)")
+    cmd.add_argument("--sizes", default=DEFAULT_SIZES, help="Corpus line counts when no paths are given")
+    cmd.add_argument("--seed", type=int, default=0)
+
+    cmd = sub.add_parser("vfc-cache", help="VFC generation with and without the repeated-line cache")
+    cmd.add_argument("paths", nargs="*", help="Files or directories (default: generated corpora)")
+    cmd.add_argument("--sizes", default=DEFAULT_SIZES, help="Corpus line counts when no paths are given")
+    cmd.add_argument("--maxsize", type=int, default=8192, help="Cache entries")
+    cmd.add_argument("--seed", type=int, default=0)
+
+    cmd = sub.add_parser("vfc-jobs", help="Chunk-parallel VFC generation of one large annotated input")
+    cmd.add_argument("--lines", type=int, default=1_000_000)
+    cmd.add_argument("--workers", default=None, help="Comma-separated worker counts (default: 1, 2, 4 .. CPUs)")
+    cmd.add_argument("--seed", type=int, default=0)
+
+    cmd = sub.add_parser("backends", help="Multi-file scaling of the process, thread and subinterpreter backends")
+    cmd.add_argument("--backends", default=None, help="Comma-separated backends (default: every available one)")
+    cmd.add_argument("--workers", default=None, help="Comma-separated worker counts (default: 1, 2, 4 .. CPUs)")
+    cmd.add_argument("--files", type=int, default=64)
+    cmd.add_argument("--lines", type=int, default=2000, help="Lines per generated file")
+
+    args = parser.parse_args(argv)
+
+    if args.command in ("backends", "vfc-jobs"):
+        if args.workers:
+            workers = [int(n) for n in args.workers.split(",") if n]
+        else:
+            cpus = os.cpu_count() or 1
+            workers = sorted({min(1 << i, cpus) for i in range(cpus.bit_length() + 1)})
+
+    if args.command == "vfc-jobs":
+        rows = VFC_scaling(workers, args.lines, args.seed)
+        for row in rows:
+            print(
+                f"{row['jobs']:>3} workers {row['lines']:>9,} lines {row['seconds']:8.2f} s"
+                f" {row['speedup']:6.2f}x  {'identical' if row['identical'] else 'DIFFERENT'}"
+            )
+        return 0 if all(row["identical"] for row in rows) else 1
+
+    if args.command == "backends":
+        import parse_multi
+        import parse_interp
+
+        if args.backends:
+            backends = [b for b in args.backends.split(",") if b]
+        else:
+            backends = ["processes", "threads"] + (["subinterpreters"] if parse_interp.available() else [])
+
+        print(f"GIL disabled: {parse_multi.gil_disabled()}")
+        rows = backend_scaling(backends, workers, args.files, args.lines)
+        for row in rows:
+            print(
+                f"{row['backend']:<15} {row['jobs']:>3} workers {row['seconds']:8.2f} s"
+                f" {row['lines_per_sec']:>12,.0f} lines/s {row['speedup']:6.2f}x"
+            )
+        return 0
+
+    if args.command == "vfc-cache":
+        if args.paths:
+            sources = _read_sources(args.paths)
+        else:
+            sources = [parse_corpus.generate_module(args.seed, int(size)) for size in args.sizes.split(",") if size]
+
+        result = compare_VFC_cache(sources, maxsize=args.maxsize)
+        cache = result["cache"]
+        print(f"{result['files']} files, {result['lines']} annotated lines")
+        print(f"uncached {result['plain_seconds']:8.3f} s")
+        print(f"cached   {result['cached_seconds']:8.3f} s  ({result['speedup']:.2f}x)")
+        print(
+            f"hit rate {cache['hit_rate']:.1%} ({cache['hits']} hits, {cache['misses']} misses,"
+            f" {cache['size']}/{cache['maxsize']} entries)"
+        )
+        return 0
+
+    if args.command == "engines":
+        if args.paths:
+            sources = _read_sources(args.paths)
+        else:
+            sources = [parse_corpus.generate_module(args.seed, int(size)) for size in args.sizes.split(",") if size]
+
+        result = compare_engines(sources)
+        print(f"{result['files']} files, {result['lines']} lines")
+        print(f"ast   {result['ast_lines_per_sec']:>12,.0f} lines/s")
+        print(
+            f"fast  {result['fast_lines_per_sec']:>12,.0f} lines/s"
+            f"  ({result['fast_lines_per_sec'] / max(result['ast_lines_per_sec'], 1e-9):.1f}x)"
+        )
+        print(
+            f"agreement: {result['files_identical']:.2%} of files identical,"
+            f" {result['span_agreement']:.2%} of blocks"
+        )
+        return 0
+
+    if args.command == "scaling":
+        rows = marker_scaling([int(n) for n in args.items.split(",") if n])
+        for row in rows:
+            print(
+                f"{row['items']:>8} items {row['chars']:>9} chars"
+                f" {row['seconds'] * 1000:9.2f} ms {row['ns_per_char']:7.1f} ns/char"
+            )
+
+        growth = rows[-1]["ns_per_char"] / rows[0]["ns_per_char"]
+        print(f"time per character grew {growth:.2f}x")
+        return 1 if growth > args.max_growth else 0
+
+    if args.command == "save":
+        sizes = [int(size) for size in args.sizes.split(",") if size]
+        path = save_baseline(args.name, run_benchmark(sizes, args.repeats, args.seed), args.dir)
+        print(f"saved {path}")
+        return 0
+
+    baseline = load_baseline(args.name, args.dir)
+    if args.sizes:
+        sizes = [int(size) for size in args.sizes.split(",") if size]
+    else:
+        sizes = [int(size) for size in baseline["results"]]
+
+    repeats = args.repeats or baseline.get("repeats", 5)
+    current = run_benchmark(sizes, repeats, baseline.get("seed", args.seed))
+
+    if baseline["machine"] != current["machine"]:
+        print("warning: baseline was recorded on a different machine/Python", file=sys.stderr)
+
+    rows = compare(baseline, current, args.threshold)
+    if not rows:
+        print(f"no sizes in common with baseline {args.name!r} ({', '.join(baseline['results'])})", file=sys.stderr)
+        return 2
+
+    print_rows(rows)
+
+    regressed = [row for row in rows if row["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} stage(s) regressed beyond {args.threshold:.0%}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,474 @@
+import os
+import ast
+import sys
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from parse_Python import CompleteStructureCommenter
+from parse_search import CACHE_DIR, load_tree
+from parse_index import iter_python_files
+
+#      Control-flow graphs per function, built on the same AST the commenter walks.
+#
+#      A graph is a list of basic blocks (first line, last line, label) plus a CSR
+#      adjacency: the successors of block i are targets[offsets[i]:offsets[i + 1]],
+#      with the matching edge kinds. Block 0 is the entry and block 1 the exit.
+#      try/finally is modelled with one finally body whose end fans out to every
+#      place a return/break/continue/raise was heading when it entered it.
+#
+#      Graphs are cached as JSON under <cache_dir>/cfg/, named by the sha1 of the
+#      function's source lines (and CFG_VERSION, bumped whenever the builder's graphs
+#      change), with line numbers stored relative to the def line. An unchanged
+#      function is never re-parsed, even when its file moved or grew.
+
+CFG_VERSION = 2
+EDGE_KINDS = ("next", "true", "false", "loop", "break", "continue", "return", "raise", "exception")
+_KIND_CODES = {kind: i for i, kind in enumerate(EDGE_KINDS)}
+FUNCTION_KINDS = ("function", "method")
+ENTRY = 0
+EXIT = 1
+
+
+def _shift(line: Optional[int], delta: int) -> Optional[int]:
+    return None if line is None else line + delta
+
+
+class ControlFlowGraph:
+    __slots__ = ("name", "start", "blocks", "offsets", "targets", "kinds")
+
+    def __init__(self, name: str, start: int, blocks: List[Tuple], offsets: List[int], targets: List[int], kinds):
+        self.name = name
+        self.start = start
+        self.blocks = blocks
+        self.offsets = offsets
+        self.targets = targets
+        self.kinds = kinds
+
+    def successors(self, block: int) -> List[Tuple[int, str]]:
+        lo, hi = self.offsets[block], self.offsets[block + 1]
+        return [(self.targets[i], EDGE_KINDS[self.kinds[i]]) for i in range(lo, hi)]
+
+    def edges(self) -> List[Tuple[int, int, str]]:
+        return [(src, dst, kind) for src in range(len(self.blocks)) for dst, kind in self.successors(src)]
+
+    def to_json(self) -> Dict:
+        #      Relative form stored in the cache: lines counted from the def line."""
+        return {
+            "name": self.name,
+            "blocks": [
+                [_shift(first, -self.start), _shift(last, -self.start), label] for first, last, label in self.blocks
+            ],
+            "offsets": self.offsets,
+            "targets": self.targets,
+            "kinds": self.kinds,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict, start: int) -> "ControlFlowGraph":
+        blocks = [(_shift(first, start), _shift(last, start), label) for first, last, label in data["blocks"]]
+        return cls(data["name"], start, blocks, data["offsets"], data["targets"], data["kinds"])
+
+    def to_dot(self) -> str:
+        out = [f'digraph "{self.name}" {{']
+        for i, (first, last, label) in enumerate(self.blocks):
+            span = f"\\n{first}-{last}" if first is not None else ""
+            out.append(f'  b{i} [label="{label}{span}"];')
+
+        for src, dst, kind in self.edges():
+            out.append(f'  b{src} -> b{dst} [label="{kind}"];')
+
+        out.append("}")
+        return "\n".join(out)
+
+
+class _Finally:
+    __slots__ = ("entry", "pending")
+
+    def __init__(self, entry: int):
+        self.entry = entry
+        self.pending = []
+
+
+class _Builder:
+    #      Walks one function body. Every visit takes the block control is in (None
+    #      when unreachable) and returns the block control falls out of."""
+
+    def __init__(self):
+        self.blocks = [[None, None, "entry"], [None, None, "exit"]]
+        self.edges = []
+        self.incoming = [0, 0]
+        self.loops = []
+        self.finals = []
+        self.in_try = 0
+
+    def new(self, label: str) -> int:
+        self.blocks.append([None, None, label])
+        self.incoming.append(0)
+        return len(self.blocks) - 1
+
+    def edge(self, src: int, dst: int, kind: str):
+        self.edges.append((src, dst, kind))
+        self.incoming[dst] += 1
+
+    def add(self, block: Optional[int], first: int, last: int) -> int:
+        if block is None:
+            block = self.new("unreachable")
+
+        span = self.blocks[block]
+        if span[0] is None:
+            span[0] = first
+        span[1] = last if span[1] is None else max(span[1], last)
+        return block
+
+    def jump(self, src: int, kind: str, target: int, depth: int):
+        #      Leave towards target, detouring through every finally opened since depth."""
+        if len(self.finals) > depth:
+            final = self.finals[-1]
+            if (kind, target, depth) not in final.pending:
+                final.pending.append((kind, target, depth))
+            self.edge(src, final.entry, kind)
+        else:
+            self.edge(src, target, kind)
+
+    def joined(self, after: int) -> Optional[int]:
+        return after if self.incoming[after] else None
+
+    def body(self, stmts: List[ast.stmt], block: Optional[int]) -> Optional[int]:
+        for stmt in stmts:
+            visit = getattr(self, "visit_" + type(stmt).__name__, None)
+            if visit is not None:
+                block = visit(stmt, block)
+            else:
+                block = self.add(block, stmt.lineno, stmt.end_lineno)
+
+        return block
+
+    def visit_FunctionDef(self, node, block):
+        #      A nested def or class only binds a name here; its body has its own graph."""
+        return self.add(block, node.lineno, node.lineno)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_ClassDef = visit_FunctionDef
+
+    def visit_Return(self, node, block):
+        block = self.add(block, node.lineno, node.end_lineno)
+        self.jump(block, "return", EXIT, 0)
+        return None
+
+    def visit_Raise(self, node, block):
+        block = self.add(block, node.lineno, node.end_lineno)
+        if not self.in_try:
+            self.jump(block, "raise", EXIT, 0)
+        return None
+
+    def visit_Break(self, node, block):
+        block = self.add(block, node.lineno, node.end_lineno)
+        if self.loops:
+            _, after, depth = self.loops[-1]
+            self.jump(block, "break", after, depth)
+        return None
+
+    def visit_Continue(self, node, block):
+        block = self.add(block, node.lineno, node.end_lineno)
+        if self.loops:
+            header, _, depth = self.loops[-1]
+            self.jump(block, "continue", header, depth)
+        return None
+
+    def visit_If(self, node, block):
+        block = self.add(block, node.lineno, node.test.end_lineno)
+        after = self.new("join")
+        then = self.new("if")
+        self.edge(block, then, "true")
+        end = self.body(node.body, then)
+        if end is not None:
+            self.edge(end, after, "next")
+
+        if node.orelse:
+            first = node.orelse[0]
+            is_elif = len(node.orelse) == 1 and isinstance(first, ast.If) and first.col_offset == node.col_offset
+            other = self.new("elif" if is_elif else "else")
+            self.edge(block, other, "false")
+            end = self.body(node.orelse, other)
+            if end is not None:
+                self.edge(end, after, "next")
+        else:
+            self.edge(block, after, "false")
+
+        return self.joined(after)
+
+    def _loop(self, node, block, header_end: int, infinite: bool):
+        header = self.new("loop")
+        if block is not None:
+            self.edge(block, header, "next")
+
+        self.add(header, node.lineno, header_end)
+        after = self.new("join")
+        body = self.new("body")
+        self.edge(header, body, "true")
+
+        self.loops.append((header, after, len(self.finals)))
+        end = self.body(node.body, body)
+        self.loops.pop()
+        if end is not None:
+            self.edge(end, header, "loop")
+
+        if node.orelse:
+            other = self.new("else")
+            if not infinite:
+                self.edge(header, other, "false")
+            end = self.body(node.orelse, other)
+            if end is not None:
+                self.edge(end, after, "next")
+        elif not infinite:
+            self.edge(header, after, "false")
+
+        return self.joined(after)
+
+    def visit_While(self, node, block):
+        infinite = isinstance(node.test, ast.Constant) and bool(node.test.value)
+        return self._loop(node, block, node.test.end_lineno, infinite)
+
+    def visit_For(self, node, block):
+        return self._loop(node, block, node.iter.end_lineno, False)
+
+    visit_AsyncFor = visit_For
+
+    def visit_With(self, node, block):
+        block = self.add(block, node.lineno, node.items[-1].context_expr.end_lineno)
+        body = self.new("with")
+        self.edge(block, body, "next")
+        end = self.body(node.body, body)
+        if end is None:
+            return None
+
+        after = self.new("join")
+        self.edge(end, after, "next")
+        return after
+
+    visit_AsyncWith = visit_With
+
+    def visit_Match(self, node, block):
+        block = self.add(block, node.lineno, node.subject.end_lineno)
+        after = self.new("join")
+        exhaustive = False
+        for case in node.cases:
+            arm = self.new("case")
+            self.add(arm, case.pattern.lineno, case.guard.end_lineno if case.guard else case.pattern.end_lineno)
+            self.edge(block, arm, "true")
+            end = self.body(case.body, arm)
+            if end is not None:
+                self.edge(end, after, "next")
+
+            exhaustive = exhaustive or (
+                case.guard is None and isinstance(case.pattern, ast.MatchAs) and case.pattern.pattern is None
+            )
+
+        if not exhaustive:
+            self.edge(block, after, "false")
+
+        return self.joined(after)
+
+    def visit_Try(self, node, block):
+        final = _Finally(self.new("finally")) if node.finalbody else None
+        after = self.new("join")
+        start = self.new("try")
+        if block is not None:
+            self.edge(block, start, "next")
+        self.add(start, node.lineno, node.lineno)
+
+        if final is not None:
+            self.finals.append(final)
+
+        self.in_try += 1
+        end = self.body(node.body, start)
+        self.in_try -= 1
+
+        raising = range(start, len(self.blocks))
+        handlers = []
+        for handler in node.handlers:
+            entry = self.new("except")
+            self.add(entry, handler.lineno, handler.type.end_lineno if handler.type else handler.lineno)
+            handlers.append(entry)
+
+        #      Without a bare except an exception may also escape: into the finally, else
+        #      to an enclosing try (whose own edges already cover these blocks) or out of
+        #      the function.
+        catch_all = any(handler.type is None for handler in node.handlers)
+        escapes = not catch_all and final is None and not self.in_try
+        for src in raising:
+            for entry in handlers:
+                self.edge(src, entry, "exception")
+            if final is not None and not catch_all:
+                self.edge(src, final.entry, "exception")
+            if escapes:
+                self.jump(src, "raise", EXIT, 0)
+
+        if final is not None and not catch_all:
+            final.pending.append(("raise", EXIT, 0))
+
+        normal = final.entry if final is not None else after
+        if node.orelse and end is not None:
+            other = self.new("else")
+            self.edge(end, other, "next")
+            end = self.body(node.orelse, other)
+
+        ends = [end] + [self.body(handler.body, entry) for handler, entry in zip(node.handlers, handlers)]
+        falls_through = False
+        for end in ends:
+            if end is not None:
+                self.edge(end, normal, "next")
+                falls_through = True
+
+        if final is None:
+            return self.joined(after)
+
+        self.finals.pop()
+        end = self.body(node.finalbody, final.entry)
+        if end is None:
+            return None
+
+        if falls_through:
+            self.edge(end, after, "next")
+        for kind, target, depth in final.pending:
+            self.jump(end, kind, target, depth)
+
+        return self.joined(after)
+
+    visit_TryStar = visit_Try
+
+    def finish(self, name: str, start: int) -> ControlFlowGraph:
+        #      Drop empty pass-through blocks, renumber, and pack edges as CSR."""
+        count = len(self.blocks)
+        out = [[] for _ in range(count)]
+        for src, dst, kind in self.edges:
+            out[src].append((dst, kind))
+
+        def empty(block: int) -> bool:
+            return block > EXIT and self.blocks[block][0] is None
+
+        def resolve(block: int, kind: str) -> Tuple[int, str]:
+            #      Follow empty blocks; a plain "next" takes the kind of the hop it runs into."""
+            seen = set()
+            while empty(block) and len(out[block]) == 1 and block not in seen:
+                seen.add(block)
+                block, hop = out[block][0]
+                if kind == "next":
+                    kind = hop
+            return block, kind
+
+        keep = [block for block in range(count) if not empty(block) or len(out[block]) > 1]
+        keep.sort(key=lambda block: (block > EXIT, self.blocks[block][0] or 0, block))
+        number = {block: i for i, block in enumerate(keep)}
+
+        offsets = [0]
+        targets = []
+        kinds = []
+        for block in keep:
+            seen = set()
+            for dst, kind in out[block]:
+                dst, kind = resolve(dst, kind)
+                dst = number.get(dst)
+                if dst is not None and (dst, kind) not in seen:
+                    seen.add((dst, kind))
+                    targets.append(dst)
+                    kinds.append(_KIND_CODES[kind])
+            offsets.append(len(targets))
+
+        blocks = [tuple(self.blocks[block]) for block in keep]
+        return ControlFlowGraph(name, start, blocks, offsets, targets, kinds)
+
+
+def build_cfg(node: ast.FunctionDef) -> ControlFlowGraph:
+    builder = _Builder()
+    first = builder.new("body")
+    builder.edge(ENTRY, first, "next")
+    end = builder.body(node.body, first)
+    if end is not None:
+        builder.edge(end, EXIT, "return")
+
+    return builder.finish(node.name, node.lineno)
+
+
+def file_cfgs(path: str, cache_dir: str = CACHE_DIR, stats: Optional[Dict[str, int]] = None) -> List[ControlFlowGraph]:
+    #      One graph per function/method in path, in source order. Function spans come
+    #      from the cached block tree; the file is parsed only if some graph is missing.
+    #      Raises OSError when path cannot be read."""
+    functions = [block for block in load_tree(path, cache_dir) if block.kind in FUNCTION_KINDS]
+    if not functions:
+        return []
+
+    with open(path, "rb") as f:
+        content = f.read().decode("utf-8", errors="replace")
+
+    lines = content.splitlines(keepends=True)
+    cfg_dir = os.path.join(cache_dir, "cfg")
+    graphs = []
+    missing = []
+    for block in functions:
+        source = f"{CFG_VERSION}\0" + "".join(lines[block.start - 1 : block.end])
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        try:
+            with open(os.path.join(cfg_dir, digest + ".json"), "r", encoding="utf-8") as f:
+                graphs.append(ControlFlowGraph.from_json(json.load(f), block.start))
+        except (OSError, ValueError):
+            graphs.append(None)
+            missing.append((len(graphs) - 1, digest))
+
+    if stats is not None:
+        stats["hits"] = stats.get("hits", 0) + len(functions) - len(missing)
+        stats["built"] = stats.get("built", 0) + len(missing)
+
+    if not missing:
+        return graphs
+
+    tree = CompleteStructureCommenter()._parse(content)
+    nodes = {node.lineno: node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)}
+    os.makedirs(cfg_dir, exist_ok=True)
+    for i, digest in missing:
+        graph = build_cfg(nodes[functions[i].start])
+        graphs[i] = graph
+        cache_file = os.path.join(cfg_dir, digest + ".json")
+        tmp = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(graph.to_json(), f, separators=(",", ":"))
+
+        os.replace(tmp, cache_file)
+
+    return graphs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-function control-flow graphs, cached by function source hash")
+    parser.add_argument("paths", nargs="+", help="Files or directories")
+    parser.add_argument("--function", help="Only graphs of functions/methods with this name")
+    parser.add_argument("--dot", action="store_true", help="Print Graphviz dot instead of a summary")
+    parser.add_argument("--cache", default=CACHE_DIR, help="Directory for persisted trees and graphs")
+    args = parser.parse_args(argv)
+
+    stats = {}
+    for path in iter_python_files(args.paths):
+        try:
+            graphs = file_cfgs(path, args.cache, stats)
+        except OSError as e:
+            print(f"error: {path}: {e}", file=sys.stderr)
+            continue
+
+        for graph in graphs:
+            if args.function and graph.name != args.function:
+                continue
+
+            if args.dot:
+                print(graph.to_dot())
+            else:
+                print(f"{path}:{graph.start}  {graph.name}  {len(graph.blocks)} blocks  {len(graph.targets)} edges")
+
+    print(f"{stats.get('hits', 0)} graphs from cache, {stats.get('built', 0)} built", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
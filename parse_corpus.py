@@ -0,0 +1,213 @@
+import os
+import sys
+import ast
+import random
+from typing import List, Optional
+
+#      Deterministic synthetic Python for stress and scaling runs. The same seed
+#      and knobs give byte-identical modules on every machine, so benchmark
+#      numbers are comparable. Every module is checked with ast.parse.
+
+WORDS = ["alpha", "beta", "gamma", "delta", "omega", "node", "token", "state", "value", "item", "block", "frame"]
+MARKERS = ["#beginif", "#endif", "#beginfor", "#endfor", "#beginfunc", "#endfunc", "#beginclass", "#begintry"]
+INDENT = "    "
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(WORDS)}_{rng.randrange(10000)}"
+
+
+def _simple(rng: random.Random, pad: str) -> str:
+    choice = rng.randrange(4)
+    if choice == 0:
+        return f"{pad}{_name(rng)} = {rng.randrange(1000)}"
+    if choice == 1:
+        return f"{pad}{_name(rng)} = \"{rng.choice(WORDS)} # not a comment\"  # trailing comment"
+    if choice == 2:
+        return f"{pad}print({_name(rng)!r})"
+    return f"{pad}pass"
+
+
+def gen_nested(rng: random.Random, depth: int, pad: str = "") -> List[str]:
+    #      A function whose body nests if/for/while/with/try depth levels deep."""
+    lines = [f"{pad}def {_name(rng)}(arg):"]
+    level = pad + INDENT
+    closers = []
+    for _ in range(depth):
+        kind = rng.randrange(5)
+        if kind == 0:
+            lines.append(f"{level}if arg > {rng.randrange(100)}:")
+            closers.append((level, "else"))
+        elif kind == 1:
+            lines.append(f"{level}for {_name(rng)} in range({rng.randrange(1, 9)}):")
+            closers.append((level, None))
+        elif kind == 2:
+            lines.append(f"{level}while arg < {rng.randrange(100)}:")
+            closers.append((level, None))
+        elif kind == 3:
+            lines.append(f"{level}with open(\"{_name(rng)}.txt\") as fh:")
+            closers.append((level, None))
+        else:
+            lines.append(f"{level}try:")
+            closers.append((level, "except"))
+
+        lines.append(_simple(rng, level + INDENT))
+        level += INDENT
+
+    lines.append(f"{level}return arg")
+    for closer_pad, closer in reversed(closers):
+        if closer == "else":
+            lines.append(f"{closer_pad}else:")
+            lines.append(_simple(rng, closer_pad + INDENT))
+        elif closer == "except":
+            lines.append(f"{closer_pad}except ValueError as e:")
+            lines.append(f"{closer_pad}{INDENT}raise")
+
+    return lines
+
+
+def gen_elif_chain(rng: random.Random, length: int, pad: str = "") -> List[str]:
+    lines = [f"{pad}def {_name(rng)}(code):"]
+    body = pad + INDENT
+    lines.append(f"{body}if code == 0:")
+    lines.append(_simple(rng, body + INDENT))
+    for i in range(1, length):
+        lines.append(f"{body}elif code == {i}:")
+        lines.append(_simple(rng, body + INDENT))
+
+    lines.append(f"{body}else:")
+    lines.append(f"{body}{INDENT}return None")
+    return lines
+
+
+def gen_wide_class(rng: random.Random, methods: int, pad: str = "") -> List[str]:
+    lines = [f"{pad}class {_name(rng).title()}:"]
+    body = pad + INDENT
+    for _ in range(methods):
+        lines.append(f"{body}def {_name(rng)}(self, x):")
+        lines.append(f"{body}{INDENT}if x:")
+        lines.append(f"{body}{INDENT * 2}return x")
+        lines.append(f"{body}{INDENT}return self")
+
+    return lines
+
+
+def gen_dict_literal(rng: random.Random, entries: int, pad: str = "") -> List[str]:
+    lines = [f"{pad}{_name(rng).upper()} = {{"]
+    for i in range(entries):
+        lines.append(f"{pad}{INDENT}\"{rng.choice(WORDS)}_{i}\": \"#{rng.choice(WORDS)}#\",")
+
+    lines.append(f"{pad}}}")
+    return lines
+
+
+def gen_hash_strings(rng: random.Random, count: int, pad: str = "") -> List[str]:
+    #      Code lines whose strings are full of '#' next to a real trailing comment."""
+    lines = []
+    for _ in range(count):
+        hashes = "#" * rng.randrange(1, 12)
+        lines.append(f"{pad}{_name(rng)} = \"{hashes} x {hashes}\" + '{hashes}'  # real {hashes}")
+
+    return lines
+
+
+def gen_fake_markers(rng: random.Random, count: int, pad: str = "") -> List[str]:
+    #      Triple-quoted strings and control lines carrying fake structure markers."""
+    lines = [f'{pad}{_name(rng).upper()} = """']
+    for _ in range(count):
+        lines.append(f"{pad}if fake: {rng.choice(MARKERS)}")
+
+    lines.append(f'{pad}"""')
+    lines.append(f"{pad}if \"{rng.choice(MARKERS)}\" in '{rng.choice(MARKERS)}':  # {rng.choice(MARKERS)} note")
+    lines.append(f"{pad}{INDENT}pass")
+    return lines
+
+
+def gen_string_heavy_line(rng: random.Random, count: int, pad: str = "") -> List[str]:
+    #      One long header line with many string literals and marker lookalikes."""
+    items = ", ".join(f"\"{rng.choice(MARKERS)}\"" if i % 3 == 0 else f"'{rng.choice(WORDS)}#{i}'" for i in range(count))
+    return [f"{pad}for {_name(rng)} in [{items}]:  # {rng.choice(MARKERS)}", f"{pad}{INDENT}pass"]
+
+
+def generate_module(
+    seed: int = 0,
+    target_lines: int = 1000,
+    depth: int = 8,
+    elif_chain: int = 60,
+    class_width: int = 30,
+    dict_entries: int = 300,
+    hash_lines: int = 40,
+    string_items: int = 50,
+) -> str:
+    #      Build one module of roughly target_lines lines from the generators above."""
+    rng = random.Random(seed)
+    lines = [f"#      synthetic module seed={seed}", "import os", "from typing import Any", ""]
+    while len(lines) < target_lines:
+        kind = rng.randrange(7)
+        if kind == 0:
+            lines += gen_nested(rng, depth)
+        elif kind == 1:
+            lines += gen_elif_chain(rng, elif_chain)
+        elif kind == 2:
+            lines += gen_wide_class(rng, class_width)
+        elif kind == 3:
+            lines += gen_dict_literal(rng, dict_entries)
+        elif kind == 4:
+            lines += gen_hash_strings(rng, hash_lines)
+        elif kind == 5:
+            lines += gen_fake_markers(rng, 10)
+        else:
+            lines += gen_string_heavy_line(rng, string_items)
+
+        lines.append("")
+
+    source = "\n".join(lines) + "\n"
+    ast.parse(source)
+    return source
+
+
+def write_corpus(out_dir: str, sizes: List[int], seed: int = 0, **knobs) -> List[str]:
+    #      One module per requested line count: <out_dir>/synth_<lines>.py."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i, size in enumerate(sizes):
+        path = os.path.join(out_dir, f"synth_{size}.py")
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(generate_module(seed + i, size, **knobs))
+
+        paths.append(path)
+
+    return paths
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic Python corpus")
+    parser.add_argument("out_dir", help="Directory for the generated modules")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated line counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--depth", type=int, default=8, help="Nesting depth of generated functions")
+    parser.add_argument("--elif-chain", type=int, default=60, help="Length of elif chains")
+    parser.add_argument("--class-width", type=int, default=30, help="Methods per generated class")
+    parser.add_argument("--dict-entries", type=int, default=300, help="Entries per dict literal")
+    parser.add_argument("--string-items", type=int, default=50, help="String literals on one long line")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    paths = write_corpus(
+        args.out_dir,
+        sizes,
+        args.seed,
+        depth=args.depth,
+        elif_chain=args.elif_chain,
+        class_width=args.class_width,
+        dict_entries=args.dict_entries,
+        string_items=args.string_items,
+    )
+    for path in paths:
+        print(path)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
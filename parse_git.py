@@ -0,0 +1,97 @@
+import os
+import sys
+import subprocess
+from typing import List, Optional, Tuple, Any
+
+import parse_multi
+
+
+def _git(args: List[str], cwd: Optional[str] = None) -> str:
+    result = subprocess.run(["git"] + args, cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"git {' '.join(args)} failed")
+
+    return result.stdout
+
+
+def changed_files(since: Optional[str] = None, staged: bool = False, cwd: Optional[str] = None) -> List[Tuple]:
+    #      Local git diff as (status, path[, new_path]) tuples with absolute paths.
+    #      since compares the working tree against a ref and also reports untracked,
+    #      non-ignored files as added; staged looks at the index only.
+    top = _git(["rev-parse", "--show-toplevel"], cwd).strip()
+
+    args = ["diff", "--name-status", "-M", "-z"]
+    if staged:
+        args.append("--cached")
+
+    if since:
+        args.append(since)
+
+    fields = _git(args, cwd).split("\0")
+    changes = []
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i][0]
+        if status in ("R", "C"):
+            changes.append((status, os.path.join(top, fields[i + 1]), os.path.join(top, fields[i + 2])))
+            i += 3
+        else:
+            changes.append((status, os.path.join(top, fields[i + 1])))
+            i += 2
+
+    if not staged:
+        for path in _git(["ls-files", "--others", "--exclude-standard", "-z"], top).split("\0"):
+            if path:
+                changes.append(("A", os.path.join(top, path)))
+
+    return changes
+
+
+def sync_changed(
+    since: Optional[str] = None,
+    staged: bool = False,
+    jobs: Optional[int] = None,
+    cwd: Optional[str] = None,
+    log: Any = sys.stderr,
+    engine: str = "ast",
+    backend: str = "auto",
+    order: str = "largest",
+) -> List[str]:
+    #      Re-annotate only the Python files git reports as changed, with parse_multi's
+    #      engine, backend and order choices. Deleted sources lose their .vfc; renamed sources
+    #      carry it to the new name."""
+    to_annotate = []
+
+    for change in changed_files(since, staged, cwd):
+        status, path = change[0], change[1]
+
+        if status == "D":
+            if path.endswith(".py") and os.path.exists(path + ".vfc"):
+                os.remove(path + ".vfc")
+                if log is not None:
+                    log.write(f"removed {path}.vfc\n")
+
+            continue
+
+        if status == "R":
+            new_path = change[2]
+            if path.endswith(".py") and os.path.exists(path + ".vfc"):
+                if new_path.endswith(".py"):
+                    os.replace(path + ".vfc", new_path + ".vfc")
+                    if log is not None:
+                        log.write(f"moved {path}.vfc -> {new_path}.vfc\n")
+                else:
+                    os.remove(path + ".vfc")
+
+            path = new_path
+
+        elif status == "C":
+            path = change[2]
+
+        if path.endswith(".py") and os.path.isfile(path):
+            to_annotate.append(path)
+
+    if to_annotate:
+        parse_multi.annotate_files(to_annotate, jobs=jobs, order=order, progress=log, engine=engine, backend=backend)
+
+    return to_annotate
@@ -0,0 +1,312 @@
+import os
+import sys
+import sqlite3
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+from parse_Python import CompleteStructureCommenter, BlockIndex
+
+#      Project-wide block index in SQLite. One row per file (keyed by path, with its
+#      content hash) and one row per block. Each block row keeps its enclosing
+#      function and its loop depth inside that function, so questions like "loops
+#      nested 4 deep" become one indexed lookup.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    hash TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    parent_id INTEGER,
+    func_id INTEGER,
+    loop_depth INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_file ON blocks(file_id, start);
+CREATE INDEX IF NOT EXISTS blocks_kind ON blocks(kind, loop_depth);
+CREATE INDEX IF NOT EXISTS blocks_name ON blocks(name);
+CREATE INDEX IF NOT EXISTS blocks_func ON blocks(func_id);
+"""
+
+FUNCTION_KINDS = ("function", "method")
+LOOP_KINDS = ("for", "while")
+SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", ".tox", ".nox", ".mypy_cache", ".pytest_cache"}
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def skip_dir(name: str) -> bool:
+    #      Directories no tree walk descends into: tool caches, virtualenvs, dot-dirs."""
+    return name in SKIP_DIRS or name.startswith(".")
+
+
+def walk_tree(root: str) -> Iterable[Tuple[str, List[str]]]:
+    #      (dirpath, filenames) for root and every directory below it that is not skipped."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not skip_dir(d))
+        yield dirpath, filenames
+
+
+def iter_python_files(paths: Iterable[str]) -> Iterable[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, filenames in walk_tree(path):
+                for filename in sorted(filenames):
+                    if filename.endswith(".py"):
+                        yield os.path.abspath(os.path.join(dirpath, filename))
+
+        elif path.endswith(".py"):
+            yield os.path.abspath(path)
+
+
+def _scan_file(path: str, known_hash: Optional[str]) -> Tuple:
+    #      Worker: (path, hash, lines, blocks, error); blocks is None when the hash is unchanged
+    #      and hash is None when the file could not be read."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return path, None, 0, [], str(e)
+
+    digest = hashlib.sha1(data).hexdigest()
+    if digest == known_hash:
+        return path, digest, None, None, None
+
+    content = data.decode("utf-8", errors="replace")
+    lines = len(content.splitlines())
+    try:
+        spans = CompleteStructureCommenter().collect_blocks(content)
+    except (SyntaxError, ValueError) as e:
+        return path, digest, lines, [], str(e)
+
+    return path, digest, lines, BlockIndex(spans).blocks, None
+
+
+def _store_blocks(conn: sqlite3.Connection, file_id: int, blocks: List):
+    row_ids = []
+    func_of = []
+    loops = []
+    for block in blocks:
+        parent_id = row_ids[block.parent] if block.parent >= 0 else None
+        if block.parent < 0:
+            func_index, loop_depth = -1, 0
+        elif blocks[block.parent].kind in FUNCTION_KINDS:
+            func_index, loop_depth = block.parent, 0
+        else:
+            func_index, loop_depth = func_of[block.parent], loops[block.parent]
+
+        if block.kind in LOOP_KINDS:
+            loop_depth += 1
+
+        cursor = conn.execute(
+            "INSERT INTO blocks (file_id, kind, name, start, end, depth, parent_id, func_id, loop_depth)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                file_id,
+                block.kind,
+                block.name,
+                block.start,
+                block.end,
+                block.depth,
+                parent_id,
+                row_ids[func_index] if func_index >= 0 else None,
+                loop_depth,
+            ),
+        )
+        row_ids.append(cursor.lastrowid)
+        func_of.append(func_index)
+        loops.append(loop_depth)
+
+
+def update_index(
+    db_path: str, paths: List[str], jobs: Optional[int] = None, prune: bool = True, log: Any = sys.stderr
+) -> Dict[str, int]:
+    #      Bring the index up to date for every .py file under paths.
+    #      Files whose (mtime, size) are unchanged are skipped without reading;
+    #      otherwise the content hash decides whether the blocks are rebuilt.
+    #      A file that cannot be read is stored with its error and no blocks, and is
+    #      tried again on the next update.
+    conn = connect(db_path)
+    known = {
+        path: (file_id, digest, mtime_ns, size)
+        for file_id, path, digest, mtime_ns, size in conn.execute("SELECT id, path, hash, mtime_ns, size FROM files")
+    }
+
+    seen = set()
+    todo = []
+    stats = {}
+    for path in iter_python_files(paths):
+        if path in seen:
+            continue
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+
+        seen.add(path)
+        stats[path] = (st.st_mtime_ns, st.st_size)
+        entry = known.get(path)
+        if entry and entry[2:] == stats[path]:
+            continue
+
+        todo.append((path, entry[1] if entry else None))
+
+    counts = {"files": len(seen), "scanned": len(todo), "rebuilt": 0, "removed": 0, "errors": 0}
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(todo)))
+    if jobs == 1:
+        results = [_scan_file(path, digest) for path, digest in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_scan_file, *zip(*todo), chunksize=16))
+
+    with conn:
+        for path, digest, lines, blocks, error in results:
+            mtime_ns, size = stats[path]
+            if blocks is None:
+                conn.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?", (mtime_ns, size, path))
+                continue
+
+            unreadable = digest is None
+            if unreadable:
+                digest, mtime_ns = "", -1
+                if log is not None:
+                    log.write(f"error: {path}: {error}\n")
+
+            if path in known:
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+            cursor = conn.execute(
+                "INSERT INTO files (path, hash, mtime_ns, size, lines, error) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, digest, mtime_ns, size, lines, error),
+            )
+            _store_blocks(conn, cursor.lastrowid, blocks)
+            counts["errors" if unreadable else "rebuilt"] += 1
+
+        if prune:
+            roots = [os.path.abspath(path) for path in paths]
+            for path in known:
+                under_root = any(path == root or path.startswith(os.path.join(root, "")) for root in roots)
+                if under_root and path not in seen:
+                    conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                    counts["removed"] += 1
+
+    conn.close()
+
+    if log is not None:
+        log.write(
+            f"{counts['files']} files, {counts['scanned']} scanned, {counts['rebuilt']} rebuilt,"
+            f" {counts['removed']} removed, {counts['errors']} unreadable\n"
+        )
+
+    return counts
+
+
+def find_blocks(
+    conn: sqlite3.Connection,
+    kind: Optional[str] = None,
+    name: Optional[str] = None,
+    file_like: Optional[str] = None,
+    min_depth: Optional[int] = None,
+    min_loop_depth: Optional[int] = None,
+) -> List[Tuple]:
+    #      (path, kind, name, start, end, depth, loop_depth, function) rows matching every filter given."""
+    where = []
+    params = []
+    if kind:
+        kinds = kind.split(",")
+        where.append(f"b.kind IN ({', '.join('?' * len(kinds))})")
+        params += kinds
+
+    if name:
+        where.append("b.name = ?")
+        params.append(name)
+
+    if file_like:
+        where.append("f.path LIKE ?")
+        params.append(file_like)
+
+    if min_depth is not None:
+        where.append("b.depth >= ?")
+        params.append(min_depth)
+
+    if min_loop_depth is not None:
+        where.append("b.loop_depth >= ?")
+        params.append(min_loop_depth)
+
+    sql = (
+        "SELECT f.path, b.kind, b.name, b.start, b.end, b.depth, b.loop_depth, fn.name"
+        " FROM blocks b JOIN files f ON f.id = b.file_id LEFT JOIN blocks fn ON fn.id = b.func_id"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    return conn.execute(sql + " ORDER BY f.path, b.start", params).fetchall()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQLite index of Python blocks across a repository")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cmd = sub.add_parser("update", help="Index (incrementally) every .py file under the given paths")
+    cmd.add_argument("db")
+    cmd.add_argument("paths", nargs="+")
+    cmd.add_argument("-j", "--jobs", type=int, default=None)
+
+    cmd = sub.add_parser("find", help="List blocks matching filters")
+    cmd.add_argument("db")
+    cmd.add_argument("--kind", help="Block kind(s), comma-separated: function,method,class,if,for,while,with,try")
+    cmd.add_argument("--name", help="Exact function/method/class name")
+    cmd.add_argument("--file", help="SQL LIKE pattern on the file path, e.g. %%/module.py")
+    cmd.add_argument("--min-depth", type=int)
+    cmd.add_argument("--min-loop-depth", type=int, help="Loops nested at least this deep inside their function")
+
+    cmd = sub.add_parser("sql", help="Run a raw SQL query against the index")
+    cmd.add_argument("db")
+    cmd.add_argument("query")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "update":
+        update_index(args.db, args.paths, jobs=args.jobs)
+        return 0
+
+    conn = connect(args.db)
+    if args.command == "find":
+        rows = find_blocks(conn, args.kind, args.name, args.file, args.min_depth, args.min_loop_depth)
+        for path, kind, name, start, end, depth, loop_depth, function in rows:
+            label = f" {name}" if name else ""
+            inside = f"  in {function}" if function else ""
+            print(f"{path}:{start}-{end}  {kind}{label}  depth={depth} loops={loop_depth}{inside}")
+
+    else:
+        for row in conn.execute(args.query):
+            print("\t".join("" if value is None else str(value) for value in row))
+
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,189 @@
+import sys
+import threading
+from typing import Any, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from parse_Python import write_VFC_file
+
+#      Experimental subinterpreter backend. Each worker thread owns one interpreter
+#      that imports the annotator once; a task passes the source bytes in and gets
+#      the annotated text and VFC bytes back, and the main interpreter writes the
+#      files. Three API generations are handled: concurrent.interpreters (3.14+),
+#      the test.support.interpreters copy with its queues (3.13), and
+#      _xxsubinterpreters with channels from _xxinterpchannels (3.12) or from
+#      _xxsubinterpreters itself (3.8-3.11). Interpreters only run in parallel where
+#      each has its own GIL, i.e. 3.12+; before that they work but share one GIL.
+
+_SETUP = """
+import sys
+for _entry in reversed(path.split("\\0")):
+    if _entry not in sys.path:
+        sys.path.insert(0, _entry)
+
+import parse_Python
+_commenter = parse_Python.CompleteStructureCommenter(engine=engine)
+"""
+
+_TASK = """
+_annotated = _commenter.add_comments_to_string(source.decode("utf-8"))
+_send(_annotated.encode("utf-8"))
+_send(parse_Python.generate_VFC(_annotated).encode("utf-8"))
+"""
+
+_available = None
+
+
+def _load_api() -> Tuple[Optional[str], Any]:
+    try:
+        from concurrent import interpreters
+
+        return "interpreters", interpreters
+    except ImportError:
+        pass
+
+    try:
+        from test.support import interpreters
+        from test.support.interpreters import queues
+
+        return "test.support", (interpreters, queues)
+    except ImportError:
+        pass
+
+    try:
+        import _xxsubinterpreters
+    except ImportError:
+        return None, None
+
+    try:
+        import _xxinterpchannels
+
+        return "xxsubinterpreters", (_xxsubinterpreters, _xxinterpchannels, "")
+    except ImportError:
+        return "xxsubinterpreters", (_xxsubinterpreters, _xxsubinterpreters, "channel_")
+
+
+def available() -> bool:
+    #      True when a worker interpreter can actually be started and annotate here
+    #      (checked once per process)."""
+    global _available
+    if _available is None:
+        api_name, api = _load_api()
+        try:
+            worker = _Worker(api_name, api, "ast")
+            try:
+                _available = worker.annotate(b"x = 1\n")[0] == b"x = 1"
+            finally:
+                worker.close()
+        except Exception:
+            _available = False
+
+    return _available
+
+
+class _Worker:
+    def __init__(self, api_name: str, api: Any, engine: str):
+        if api_name is None:
+            raise RuntimeError("subinterpreters are not available in this Python")
+
+        self.api_name = api_name
+        shared = {"path": "\0".join(sys.path), "engine": engine}
+        if api_name == "xxsubinterpreters":
+            self.interps, self.channels, prefix = api
+            self.interp = self.interps.create()
+            self.channel = getattr(self.channels, prefix + "create")()
+            self.recv = getattr(self.channels, prefix + "recv")
+            self.destroy_channel = getattr(self.channels, prefix + "destroy")
+            shared["cid"] = int(self.channel)
+            setup = f"import {self.channels.__name__} as _channels\n"
+            setup += f"_send = lambda data: _channels.{prefix}send(cid, data)\n"
+            self.interps.run_string(self.interp, _SETUP + setup, shared)
+        elif api_name == "test.support":
+            #      3.13 queues are not shareable through prepare_main; the worker
+            #      reopens its queue by id instead.
+            interpreters, queues = api
+            self.interp = interpreters.create()
+            self.queue = queues.create()
+            self.interp.prepare_main(qid=self.queue.id, **shared)
+            setup = "from test.support.interpreters import queues\n_send = queues.Queue(qid).put\n"
+            self.interp.exec(_SETUP + setup)
+        else:
+            self.interp = api.create()
+            self.queue = api.create_queue()
+            self.interp.prepare_main(queue=self.queue, **shared)
+            self.interp.exec(_SETUP + "_send = queue.put\n")
+
+    def annotate(self, source: bytes) -> Tuple[bytes, bytes]:
+        if self.api_name == "xxsubinterpreters":
+            self.interps.run_string(self.interp, _TASK, {"source": source})
+            return self.recv(self.channel), self.recv(self.channel)
+
+        self.interp.prepare_main(source=source)
+        self.interp.exec(_TASK)
+        return self.queue.get(), self.queue.get()
+
+    def close(self):
+        if self.api_name == "xxsubinterpreters":
+            self.destroy_channel(self.channel)
+            self.interps.destroy(self.interp)
+        else:
+            self.interp.close()
+
+
+class SubinterpreterPool:
+    #      max_workers threads, each driving its own interpreter (created on first use)."""
+
+    def __init__(self, max_workers: int, engine: str = "ast"):
+        self.api_name, self.api = _load_api()
+        if self.api_name is None:
+            raise RuntimeError("subinterpreters are not available in this Python")
+
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.local = threading.local()
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def _worker(self) -> _Worker:
+        worker = getattr(self.local, "worker", None)
+        if worker is None:
+            worker = _Worker(self.api_name, self.api, self.engine)
+            self.local.worker = worker
+            with self.lock:
+                self.workers.append(worker)
+
+        return worker
+
+    def annotate_file(self, path: str) -> Tuple[str, int, int, None, Optional[str]]:
+        #      Same (path, lines, bytes, metrics, error) row as parse_multi's tasks; no metrics.
+        #      The source is decoded here first so a bad file is an error row, not a failure
+        #      inside the worker interpreter."""
+        try:
+            with open(path, "rb") as f:
+                source = f.read()
+
+            source.decode("utf-8")
+        except (OSError, UnicodeDecodeError) as exc:
+            return path, 0, 0, None, f"{type(exc).__name__}: {exc}"
+
+        annotated, VFC = self._worker().annotate(source)
+        write_VFC_file(path, VFC.decode("utf-8"))
+        return path, annotated.count(b"\n") + 1, len(source), None, None
+
+    def _annotate_task(self, paths: List[str]) -> List[Tuple[str, int, int, None, Optional[str]]]:
+        return [self.annotate_file(path) for path in paths]
+
+    def submit_task(self, paths: List[str]) -> Future:
+        return self.executor.submit(self._annotate_task, paths)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for worker in self.workers:
+            worker.close()
+
+        self.workers = []
+
+    def __enter__(self) -> "SubinterpreterPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,222 @@
+import os
+import sys
+import time
+from typing import List, Dict, Optional, Tuple, Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from parse_Python import CompleteStructureCommenter, StructureContext, generate_VFC, write_VFC_file
+
+#      Files below SMALL_FILE_BYTES are packed together until a task holds
+#      CHUNK_BYTES, so one pickled round trip carries many tiny modules.
+SMALL_FILE_BYTES = 32 * 1024
+CHUNK_BYTES = 256 * 1024
+BACKENDS = ("auto", "processes", "threads", "subinterpreters")
+
+
+def gil_disabled() -> bool:
+    #      True on a free-threaded CPython build running with the GIL off."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def resolve_backend(backend: str) -> str:
+    #      "auto" means threads when the GIL is off, processes otherwise; the
+    #      experimental subinterpreter backend is only used when asked for."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+    if backend == "auto":
+        return "threads" if gil_disabled() else "processes"
+
+    return backend
+
+
+def stat_inputs(paths: List[str]) -> List[Tuple[str, int]]:
+    #      Pair every input path with its size in bytes."""
+    sized = []
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+
+        sized.append((path, size))
+
+    return sized
+
+
+def plan_tasks(
+    sized: List[Tuple[str, int]], small_bytes: int = SMALL_FILE_BYTES, chunk_bytes: int = CHUNK_BYTES
+) -> List[Tuple[int, List[str]]]:
+    #      Largest-first plan: big files alone, small files chunked, heaviest task first."""
+    tasks = []
+    chunk = []
+    chunk_size = 0
+
+    for path, size in sorted(sized, key=lambda x: x[1], reverse=True):
+        if size >= small_bytes:
+            tasks.append((size, [path]))
+            continue
+
+        chunk.append(path)
+        chunk_size += size
+        if chunk_size >= chunk_bytes:
+            tasks.append((chunk_size, chunk))
+            chunk = []
+            chunk_size = 0
+
+    if chunk:
+        tasks.append((chunk_size, chunk))
+
+    tasks.sort(key=lambda x: x[0], reverse=True)
+    return tasks
+
+
+def annotate_one(
+    path: str, commenter: Optional[CompleteStructureCommenter] = None, context: Optional[StructureContext] = None
+) -> Tuple[str, int, int]:
+    #      Annotate one file and write its .vfc; returns (path, lines, bytes)."""
+    if commenter is None:
+        commenter = CompleteStructureCommenter()
+
+    modified_code = commenter.add_comments(path, context=context)
+    write_VFC_file(path, generate_VFC(modified_code))
+
+    return path, modified_code.count("\n") + 1, os.path.getsize(path)
+
+
+def _annotate_task(
+    paths: List[str], metrics: bool = False, engine: str = "ast"
+) -> List[Tuple[str, int, int, Optional[List], Optional[str]]]:
+    #      (path, lines, bytes, metrics, error) per file; metrics is None unless requested.
+    #      A file that cannot be read or decoded gives (path, 0, 0, None, message) and the
+    #      rest of the task carries on."""
+    commenter = CompleteStructureCommenter(metrics=metrics, engine=engine)
+    results = []
+    for path in paths:
+        context = StructureContext()
+        try:
+            row = annotate_one(path, commenter, context)
+        except (OSError, UnicodeDecodeError) as exc:
+            results.append((path, 0, 0, None, f"{type(exc).__name__}: {exc}"))
+            continue
+
+        results.append(row + (context.metrics if metrics else None, None))
+
+    return results
+
+
+def _report_error(progress, path, error):
+    if progress is not None:
+        progress.write(f"error: {path}: {error}\n")
+        progress.flush()
+
+
+def _report(progress, done_files, total_files, done_lines, done_bytes, total_bytes, elapsed):
+    if progress is None:
+        return
+
+    rate = done_lines / elapsed if elapsed > 0 else 0.0
+    byte_rate = done_bytes / elapsed if elapsed > 0 else 0.0
+    eta = (total_bytes - done_bytes) / byte_rate if byte_rate > 0 else 0.0
+
+    progress.write(f"[{done_files}/{total_files}] {done_lines} lines  {rate:,.0f} lines/s  ETA {eta:.1f}s\n")
+    progress.flush()
+
+
+def annotate_files(
+    paths: List[str],
+    jobs: Optional[int] = None,
+    order: str = "largest",
+    progress: Any = sys.stderr,
+    metrics: bool = False,
+    engine: str = "ast",
+    backend: str = "auto",
+) -> Dict[str, Any]:
+    #      Annotate many files across workers: processes, or threads (which skip pickling
+    #      and process start-up, and scale once the GIL is off), or subinterpreters
+    #      (parse_interp; no metrics).
+    #      order="largest" stats inputs and dispatches the heaviest tasks first;
+    #      order="given" submits one file per task in input order (plain map).
+    #      With metrics=True the result also carries (path, FunctionMetrics) rows,
+    #      computed by the workers in the same parse. Files that cannot be read or
+    #      decoded are reported and listed as (path, message) under "errors".
+    sized = stat_inputs(paths)
+    total_bytes = sum(size for _, size in sized)
+
+    if order == "largest":
+        tasks = plan_tasks(sized)
+    else:
+        tasks = [(size, [path]) for path, size in sized]
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(tasks)))
+    backend = resolve_backend(backend)
+    if metrics and backend == "subinterpreters":
+        raise ValueError("metrics are not supported by the subinterpreters backend")
+
+    start = time.perf_counter()
+    done_files = 0
+    done_lines = 0
+    done_bytes = 0
+    metric_rows = {}
+    errors = []
+
+    if jobs == 1 and backend != "subinterpreters":
+        results = (_annotate_task(task_paths, metrics, engine) for _, task_paths in tasks)
+        for result in results:
+            for path, lines, size, rows, error in result:
+                done_files += 1
+                if error is not None:
+                    errors.append((path, error))
+                    _report_error(progress, path, error)
+                    continue
+
+                done_lines += lines
+                done_bytes += size
+                metric_rows[path] = rows
+
+            _report(progress, done_files, len(sized), done_lines, done_bytes, total_bytes, time.perf_counter() - start)
+
+    else:
+        if backend == "subinterpreters":
+            import parse_interp
+
+            executor = parse_interp.SubinterpreterPool(jobs, engine)
+            submit = executor.submit_task
+        else:
+            executor_class = ThreadPoolExecutor if backend == "threads" else ProcessPoolExecutor
+            executor = executor_class(max_workers=jobs)
+            submit = lambda task_paths: executor.submit(_annotate_task, task_paths, metrics, engine)
+
+        with executor:
+            futures = [submit(task_paths) for _, task_paths in tasks]
+            for future in as_completed(futures):
+                for path, lines, size, rows, error in future.result():
+                    done_files += 1
+                    if error is not None:
+                        errors.append((path, error))
+                        _report_error(progress, path, error)
+                        continue
+
+                    done_lines += lines
+                    done_bytes += size
+                    metric_rows[path] = rows
+
+                elapsed = time.perf_counter() - start
+                _report(progress, done_files, len(sized), done_lines, done_bytes, total_bytes, elapsed)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "files": done_files,
+        "lines": done_lines,
+        "bytes": done_bytes,
+        "seconds": elapsed,
+        "lines_per_sec": done_lines / elapsed if elapsed > 0 else 0.0,
+        "backend": backend,
+        "jobs": jobs,
+        "errors": errors,
+    }
+    if metrics:
+        stats["metrics"] = [(path, row) for path in paths if metric_rows.get(path) for row in metric_rows[path]]
+
+    return stats
@@ -0,0 +1,61 @@
+import sys
+import tracemalloc
+from typing import Any
+
+from parse_Python import StructureObserver
+
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+class MemoryProfiler(StructureObserver):
+    #      tracemalloc around every phase: peak, retained and top allocation sites.
+    #      Traces are cleared when a phase starts, so the numbers only cover what that
+    #      phase allocated (the AST in parse, parent_map in collect, result_lines in
+    #      apply, the VFC string in VFC) and the end snapshot stays small.
+
+    def __init__(self, top: int = 5):
+        self.top = top
+        self.phases = []
+        self._started_here = False
+
+    def on_phase_start(self, phase: str):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_here = True
+
+        tracemalloc.clear_traces()
+
+    def on_phase_end(self, phase: str, seconds: float):
+        retained, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        top = []
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            frame = stat.traceback[0]
+            top.append((f"{frame.filename}:{frame.lineno}", stat.size, stat.count))
+
+        self.phases.append({"phase": phase, "seconds": seconds, "peak": peak, "retained": retained, "top": top})
+
+    def stop(self):
+        if self._started_here:
+            tracemalloc.stop()
+            self._started_here = False
+
+    def report(self, out: Any = sys.stderr):
+        for entry in self.phases:
+            out.write(
+                f"{entry['phase']:<8} {entry['seconds'] * 1000:9.1f} ms  peak {_kb(entry['peak'])}"
+                f"  retained {_kb(entry['retained'])}\n"
+            )
+            for site, size, count in entry["top"]:
+                out.write(f"    {_kb(size)}  {count:8d} allocs  {site}\n")
+
+        out.flush()
+
+
+def _kb(size: int) -> str:
+    return f"{size / 1024:11,.1f} KiB"
@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+import json
+import hashlib
+from typing import Any, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+from parse_Python import CompleteStructureCommenter, BlockIndex, Block
+from parse_index import iter_python_files
+
+#      Structural grep over persisted block trees.
+#
+#      A query is a CSS-like path of block steps, outermost first:
+#          method for with          a with inside a for inside a method (any depth)
+#          class > method           a method directly inside a class
+#          if[!else][depth>=3]      an if with no else, nested 3 or more blocks deep
+#      Kinds: function, method, def (either), class, if, for, while, loop (for/while),
+#      with, try, * (any). Predicates: else, !else, name=NAME, depth OP N.
+#
+#      Trees are cached one file per source under CACHE_DIR, named by content hash,
+#      so a query never re-parses unchanged files.
+
+CACHE_DIR = ".pyparse-cache"
+KIND_ALIASES = {"def": ("function", "method"), "loop": ("for", "while")}
+_TOKEN_RE = re.compile(r"\s*(>|[^\s>\[]+(?:\[[^\]]*\])*|\S+)")
+_STEP_RE = re.compile(r"^(\*|[a-z]+)((?:\[[^\]]+\])*)$")
+_PRED_RE = re.compile(r"^(!?else|name=.+|depth(?:>=|<=|>|<|=)\d+)$")
+_OPS = {
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+    "=": lambda a, b: a == b,
+}
+
+
+class StructuralQuery:
+    #      A query compiled into a top-down tree automaton over block trees.
+    #      State i means "the first i steps matched on the path so far". A block's
+    #      state sets are derived from its parent's and memoised by (parent states,
+    #      block features), so each distinct transition is evaluated once per query.
+
+    def __init__(self, text: str):
+        self.text = text
+        self.steps = []
+        self.uses_name = False
+        child = False
+
+        for token in _TOKEN_RE.findall(text):
+            if token == ">":
+                child = True
+                continue
+
+            match = _STEP_RE.match(token)
+            if not match:
+                raise ValueError(f"bad query step: {token!r}")
+
+            kind = match.group(1)
+            kinds = None if kind == "*" else frozenset(KIND_ALIASES.get(kind, (kind,)))
+            preds = re.findall(r"\[([^\]]+)\]", match.group(2))
+            for pred in preds:
+                if not _PRED_RE.match(pred):
+                    raise ValueError(f"bad predicate: [{pred}]")
+
+                self.uses_name = self.uses_name or pred.startswith("name=")
+
+            self.steps.append((kinds, self._compile_predicates(preds), child))
+            child = False
+
+        if not self.steps:
+            raise ValueError("empty query")
+
+        self.accept = 1 << len(self.steps)
+        self.desc_mask = sum(1 << i for i, (_, _, is_child) in enumerate(self.steps) if not is_child)
+        self.child_mask = sum(1 << i for i, (_, _, is_child) in enumerate(self.steps) if is_child)
+        self._transitions = {}
+
+    @staticmethod
+    def _compile_predicates(preds: List[str]):
+        checks = []
+        for pred in preds:
+            if pred == "else":
+                checks.append(lambda kind, name, depth, has_else: has_else)
+            elif pred == "!else":
+                checks.append(lambda kind, name, depth, has_else: not has_else)
+            elif pred.startswith("name="):
+                wanted = pred[5:]
+                checks.append(lambda kind, name, depth, has_else, wanted=wanted: name == wanted)
+            else:
+                op = re.match(r"depth(>=|<=|>|<|=)", pred).group(1)
+                limit = int(pred[5 + len(op) :])
+                check = _OPS[op]
+                checks.append(lambda kind, name, depth, has_else, check=check, limit=limit: check(depth, limit))
+
+        return checks
+
+    def _step(self, keep: int, reached: int, features: Tuple) -> int:
+        key = (keep, reached, features)
+        new = self._transitions.get(key)
+        if new is not None:
+            return new
+
+        kind, name, depth, has_else = features
+        candidates = (keep & self.desc_mask) | (reached & self.child_mask)
+        new = 0
+        i = 0
+        while candidates >> i:
+            if candidates >> i & 1:
+                kinds, checks, _ = self.steps[i]
+                if (kinds is None or kind in kinds) and all(check(kind, name, depth, has_else) for check in checks):
+                    new |= 1 << (i + 1)
+
+            i += 1
+
+        self._transitions[key] = new
+        return new
+
+    def run(self, blocks: List) -> List:
+        #      Blocks (parents before children) matched by the last step."""
+        keep = [0] * len(blocks)
+        reached = [0] * len(blocks)
+        matches = []
+        for i, block in enumerate(blocks):
+            if block.parent >= 0:
+                parent_keep, parent_reached = keep[block.parent], reached[block.parent]
+            else:
+                parent_keep, parent_reached = 1, 1
+
+            features = (block.kind, block.name if self.uses_name else None, block.depth, block.has_else)
+            new = self._step(parent_keep, parent_reached, features)
+            reached[i] = new
+            keep[i] = parent_keep | new
+            if new & self.accept:
+                matches.append(block)
+
+        return matches
+
+
+def load_tree(path: str, cache_dir: str = CACHE_DIR) -> List:
+    #      Blocks of path, from <cache_dir>/<sha1>.json when present, else parsed and stored."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    cache_file = os.path.join(cache_dir, hashlib.sha1(data).hexdigest() + ".json")
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    except (OSError, ValueError):
+        rows = None
+
+    if rows is None:
+        try:
+            spans = CompleteStructureCommenter().collect_blocks(data.decode("utf-8", errors="replace"))
+        except (SyntaxError, ValueError):
+            spans = []
+
+        rows = [list(block) for block in BlockIndex(spans).blocks]
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rows, f, separators=(",", ":"))
+
+        os.replace(tmp, cache_file)
+
+    return [Block(*row) for row in rows]
+
+
+_worker_query = None
+
+
+def _init_worker(text: str):
+    global _worker_query
+    _worker_query = StructuralQuery(text)
+
+
+def _search_chunk(paths: List[str], cache_dir: str) -> Tuple[List[Tuple], List[Tuple[str, str]]]:
+    #      (matches, errors); a file that cannot be read becomes a (path, message) error."""
+    results = []
+    errors = []
+    for path in paths:
+        try:
+            blocks = load_tree(path, cache_dir)
+        except OSError as e:
+            errors.append((path, str(e)))
+            continue
+
+        for block in _worker_query.run(blocks):
+            results.append((path, block.start, block.end, block.kind, block.name))
+
+    return results, errors
+
+
+def search(
+    text: str, paths: List[str], jobs: Optional[int] = None, cache_dir: str = CACHE_DIR, log: Any = sys.stderr
+) -> List[Tuple]:
+    #      (path, start, end, kind, name) for every block matching the query under paths.
+    #      Files that cannot be read are reported to log and skipped."""
+    StructuralQuery(text)
+    files = list(iter_python_files(paths))
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(files)))
+    if jobs == 1:
+        _init_worker(text)
+        results, errors = _search_chunk(files, cache_dir)
+    else:
+        chunk = max(1, len(files) // (jobs * 4))
+        chunks = [files[i : i + chunk] for i in range(0, len(files), chunk)]
+        results = []
+        errors = []
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(text,)) as executor:
+            for found, failed in executor.map(_search_chunk, chunks, [cache_dir] * len(chunks)):
+                results.extend(found)
+                errors.extend(failed)
+
+    if log is not None:
+        for path, error in errors:
+            log.write(f"error: {path}: {error}\n")
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Structural search over Python block trees")
+    parser.add_argument("query", help="e.g. 'method for with' or 'if[!else][depth>=3]'")
+    parser.add_argument("paths", nargs="+", help="Files or directories")
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument("--cache", default=CACHE_DIR, help="Directory for persisted block trees")
+    args = parser.parse_args(argv)
+
+    try:
+        results = search(args.query, args.paths, args.jobs, args.cache)
+    except ValueError as e:
+        parser.error(str(e))
+
+    for path, start, end, kind, name in results:
+        label = f" {name}" if name else ""
+        print(f"{path}:{start}-{end}  {kind}{label}")
+
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,428 @@
+import re
+import sys
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from parse_Python import CompleteStructureCommenter, Block, BlockIndex, scan_blocks, scan_line
+from parse_stream import CONTINUATION_KEYWORDS, iter_top_level_chunks
+
+#      A small stdio JSON-RPC (Language Server Protocol subset) structure service:
+#      initialize, textDocument/didOpen, didChange (full or incremental), didClose,
+#      textDocument/foldingRange, textDocument/documentSymbol and a custom
+#      pyparse/enclosingBlocks request for breadcrumbs and "jump to end of block".
+#
+#      Each document is kept as top-level statement chunks, each with its own blocks
+#      and block index; a chunk the AST rejects gets its blocks from the indentation
+#      engine. An edit inside the body of a def or class is first re-parsed as just
+#      that block (the innermost one, wrapped under "if 1:" when indented), and only
+#      the chunk's spans are adjusted. Otherwise the touched chunks are re-chunked and
+#      re-parsed, together with a neighbour only when the edit reaches a chunk
+#      boundary: the rebuilt region starts with an indented line or a continuation
+#      keyword, the chunk before it ends open (bracket, string, backslash,
+#      decorator), the rebuilt region ends open, or the chunk after it starts with a
+#      continuation. While a bracket or triple quote is left open, later chunks keep
+#      their last good structure; the open chunk heals on the edit that closes it,
+#      and didOpen or a full-text didChange resynchronises everything.
+
+_LINE_RE = re.compile(r"[^\n]*\n|[^\n]+$")
+SYMBOL_KINDS = {"class": 5, "method": 6, "function": 12}
+_SELF_CONTAINED = {"function": ("function",), "method": ("function",), "class": ("class",)}
+
+
+def split_lines(text: str) -> List[str]:
+    return _LINE_RE.findall(text)
+
+
+class Chunk:
+    #      One top-level statement. A chunk the AST rejects is broken: its blocks come from
+    #      the indentation engine, and open_end says whether it stops inside a bracket or
+    #      string, after a backslash or on a decorator, i.e. may continue into the next one."""
+
+    __slots__ = ("start", "length", "blocks", "broken", "open_end", "_index")
+
+    def __init__(self, start: int, length: int, blocks: List[Tuple], broken: bool = False, open_end: bool = False):
+        self.start = start
+        self.length = length
+        self.blocks = blocks
+        self.broken = broken
+        self.open_end = open_end
+        self._index = None
+
+    def index(self) -> BlockIndex:
+        #      Block tree of this chunk, in chunk-relative 1-based lines; kept until the chunk changes."""
+        if self._index is None:
+            self._index = BlockIndex(self.blocks)
+
+        return self._index
+
+
+class StructureModel:
+    #      Incremental block structure of one document (0-based line numbers inside)."""
+
+    def __init__(self, text: str):
+        self.lines = split_lines(text)
+        self.chunks = self._build(0, len(self.lines))
+
+    def _build(self, start: int, stop: int) -> List[Chunk]:
+        #      Chunk and parse lines[start:stop]; the region must begin at a statement start."""
+        lines = iter(self.lines[start:stop])
+        chunks = []
+        line = start
+        commenter = CompleteStructureCommenter()
+        for text in iter_top_level_chunks(lambda: next(lines, "")):
+            length = text.count("\n") + (0 if text.endswith("\n") else 1)
+            try:
+                chunks.append(Chunk(line, length, commenter.collect_blocks(text)))
+            except (SyntaxError, ValueError):
+                chunk_lines = text.splitlines()
+                chunks.append(Chunk(line, length, scan_blocks(chunk_lines), True, _open_end(chunk_lines)))
+
+            line += length
+
+        return chunks
+
+    def replace(self, start_line: int, start_char: int, end_line: int, end_char: int, text: str):
+        #      Apply one edit; positions are 0-based (line, code-point column)."""
+        old_count = len(self.lines)
+        head = self.lines[start_line][:start_char] if start_line < old_count else ""
+        tail = self.lines[end_line][end_char:] if end_line < old_count else ""
+        new_lines = split_lines(head + text + tail)
+        self.lines[start_line : end_line + 1] = new_lines
+        delta = len(self.lines) - old_count
+
+        if not self.chunks:
+            self.chunks = self._build(0, len(self.lines))
+            return
+
+        first = self._chunk_at(start_line)
+        last = self._chunk_at(end_line)
+        if first == last and self._reparse_block(self.chunks[first], start_line, end_line, delta):
+            shifted = first + 1
+        else:
+            shifted = self._rechunk(first, last, delta)
+
+        for chunk in self.chunks[shifted:]:
+            chunk.start += delta
+
+    def _reparse_block(self, chunk: Chunk, start_line: int, end_line: int, delta: int) -> bool:
+        #      Re-parse only the innermost def/class whose body (below its header line) holds the
+        #      whole edit. Succeeds when the block still parses on its own and still ends on the
+        #      region's last code line, i.e. the chunk's statement boundaries cannot have moved."""
+        rel_start = start_line - chunk.start + 1
+        rel_end = end_line - chunk.start + 1
+        root = None
+        for span in chunk.blocks:
+            if span[2] in _SELF_CONTAINED and span[0] < rel_start and rel_end <= span[1]:
+                if root is None or span[0] > root[0]:
+                    root = span
+
+        if root is None:
+            return False
+
+        root_start, root_end, root_kind = root[:3]
+        first = chunk.start + root_start - 1
+        last = chunk.start + root_end - 1 + delta
+        region = self.lines[first : last + 1]
+        wrapped = region[0][:1] in (" ", "\t")
+        text = ("if 1:\n" if wrapped else "") + "".join(region)
+        try:
+            spans = CompleteStructureCommenter().collect_blocks(text)
+        except (SyntaxError, ValueError):
+            if not chunk.broken:
+                return False
+
+            spans = scan_blocks(text.splitlines())
+
+        offset = 1 if wrapped else 0
+        code_end = len(region)
+        while code_end > 0 and (not region[code_end - 1].strip() or region[code_end - 1].lstrip().startswith("#")):
+            code_end -= 1
+
+        top = [span for span in spans if span[0] == 1 + offset]
+        if len(top) != 1 or top[0][2] not in _SELF_CONTAINED[root_kind] or top[0][1] != code_end + offset:
+            return False
+
+        new_end = root_start + code_end - 1
+        blocks = []
+        for span in chunk.blocks:
+            start, end = span[0], span[1]
+            if start >= root_start and end <= root_end:
+                continue
+
+            if start > root_end:
+                blocks.append((start + delta, end + delta) + span[2:])
+            elif end >= root_end:
+                blocks.append((start, new_end if end == root_end else end + delta) + span[2:])
+            else:
+                blocks.append(span)
+
+        for start, end, kind, name, has_else in spans:
+            if start > offset:
+                kind = root_kind if start == 1 + offset else kind
+                blocks.append((start - offset + root_start - 1, end - offset + root_start - 1, kind, name, has_else))
+
+        chunk.blocks = blocks
+        chunk.length += delta
+        chunk._index = None
+        return True
+
+    def _rechunk(self, first: int, last: int, delta: int) -> int:
+        #      Re-chunk chunks[first:last + 1] (plus a neighbour on a side the edit reaches);
+        #      returns the index of the first chunk after the rebuilt ones."""
+        rebuilt = self._build(self.chunks[first].start, self.chunks[last].start + self.chunks[last].length + delta)
+        grow_left = first > 0 and (self.chunks[first - 1].open_end or not self._clean_start(rebuilt, 0))
+        grow_right = last + 1 < len(self.chunks) and (
+            (rebuilt and rebuilt[-1].open_end) or not self._clean_start(self.chunks[last + 1 :], delta)
+        )
+        if grow_left or grow_right:
+            first -= grow_left
+            last += grow_right
+            stop = self.chunks[last].start + self.chunks[last].length + delta
+            rebuilt = self._build(self.chunks[first].start, stop)
+
+        self.chunks[first : last + 1] = rebuilt
+        return first + len(rebuilt)
+
+    def _clean_start(self, chunks: List[Chunk], delta: int) -> bool:
+        #      Whether the first chunk (its lines shifted by delta) opens a fresh top-level
+        #      statement rather than continuing the one before it."""
+        if not chunks:
+            return True
+
+        chunk = chunks[0]
+        for line in self.lines[chunk.start + delta : chunk.start + delta + chunk.length]:
+            stripped = line.strip()
+            if stripped and not stripped.startswith("#"):
+                word = re.match(r"\w*", stripped).group()
+                return line[:1] not in (" ", "\t") and word not in CONTINUATION_KEYWORDS
+
+        return True
+
+    def _chunk_at(self, line: int) -> int:
+        lo, hi = 0, len(self.chunks) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.chunks[mid].start <= line:
+                lo = mid
+            else:
+                hi = mid - 1
+
+        return max(lo, 0)
+
+    def iter_blocks(self) -> Iterator[Block]:
+        #      Every block in document order, with absolute 1-based lines."""
+        for chunk in self.chunks:
+            for block in chunk.index().blocks:
+                yield block._replace(start=block.start + chunk.start, end=block.end + chunk.start)
+
+    def enclosing_blocks(self, line: int) -> List[Block]:
+        #      Blocks containing 1-based line, outermost first."""
+        if not self.chunks:
+            return []
+
+        chunk = self.chunks[self._chunk_at(line - 1)]
+        return [
+            block._replace(start=block.start + chunk.start, end=block.end + chunk.start)
+            for block in chunk.index().enclosing_blocks(line - chunk.start)
+        ]
+
+
+def _open_end(lines: List[str]) -> bool:
+    #      Whether a broken chunk may run on into the next one."""
+    quote = None
+    depth = 0
+    backslash = False
+    last_code = ""
+    for line in lines:
+        in_string = quote is not None
+        quote, depth, comment, backslash = scan_line(line, quote, depth)
+        if not in_string and line[:comment].strip():
+            last_code = line.lstrip()
+
+    return quote is not None or depth > 0 or backslash or last_code.startswith("@")
+
+
+def _utf16_to_index(line: str, units: int) -> int:
+    if line.isascii():
+        return units
+
+    count = 0
+    for i, ch in enumerate(line):
+        if count >= units:
+            return i
+        count += 2 if ord(ch) > 0xFFFF else 1
+
+    return len(line)
+
+
+class StructureServer:
+    def __init__(self, stdin=None, stdout=None):
+        self.stdin = stdin or sys.stdin.buffer
+        self.stdout = stdout or sys.stdout.buffer
+        self.documents = {}
+        self.running = True
+
+    def read_message(self) -> Optional[Dict[str, Any]]:
+        length = None
+        while True:
+            header = self.stdin.readline()
+            if not header:
+                return None
+
+            header = header.strip()
+            if not header:
+                break
+
+            name, _, value = header.decode("ascii").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+
+        if length is None:
+            return None
+
+        return json.loads(self.stdin.read(length).decode("utf-8"))
+
+    def send(self, message: Dict[str, Any]):
+        body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        self.stdout.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        self.stdout.flush()
+
+    def serve(self):
+        while self.running:
+            message = self.read_message()
+            if message is None:
+                break
+
+            self.dispatch(message)
+
+    def dispatch(self, message: Dict[str, Any]):
+        method = message.get("method")
+        params = message.get("params") or {}
+        handler = getattr(self, "on_" + (method or "").replace("/", "_").replace("$", "S"), None)
+
+        if "id" not in message:
+            #      A notification has no reply to carry an error, so it is logged and the
+            #      server keeps running.
+            if handler is not None:
+                try:
+                    handler(params)
+                except Exception as e:
+                    sys.stderr.write(f"error: {method}: {type(e).__name__}: {e}\n")
+                    sys.stderr.flush()
+            return
+
+        if handler is None:
+            self.send(
+                {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32601, "message": f"{method} not handled"}}
+            )
+            return
+
+        try:
+            result = handler(params)
+        except Exception as e:
+            self.send({"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32603, "message": str(e)}})
+            return
+
+        self.send({"jsonrpc": "2.0", "id": message["id"], "result": result})
+
+    def on_initialize(self, params):
+        return {
+            "capabilities": {
+                "textDocumentSync": {"openClose": True, "change": 2},
+                "foldingRangeProvider": True,
+                "documentSymbolProvider": True,
+            },
+            "serverInfo": {"name": "parse_Python structure server"},
+        }
+
+    def on_initialized(self, params):
+        pass
+
+    def on_shutdown(self, params):
+        return None
+
+    def on_exit(self, params):
+        self.running = False
+
+    def on_textDocument_didOpen(self, params):
+        document = params["textDocument"]
+        self.documents[document["uri"]] = StructureModel(document["text"])
+
+    def on_textDocument_didClose(self, params):
+        self.documents.pop(params["textDocument"]["uri"], None)
+
+    def on_textDocument_didChange(self, params):
+        uri = params["textDocument"]["uri"]
+        for change in params["contentChanges"]:
+            if "range" not in change:
+                self.documents[uri] = StructureModel(change["text"])
+                continue
+
+            model = self.documents[uri]
+            start, end = change["range"]["start"], change["range"]["end"]
+            lines = model.lines
+            start_char = _utf16_to_index(lines[start["line"]], start["character"]) if start["line"] < len(lines) else 0
+            end_char = _utf16_to_index(lines[end["line"]], end["character"]) if end["line"] < len(lines) else 0
+            model.replace(start["line"], start_char, end["line"], end_char, change["text"])
+
+    def on_textDocument_foldingRange(self, params):
+        model = self.documents[params["textDocument"]["uri"]]
+        return [
+            {"startLine": block.start - 1, "endLine": block.end - 1}
+            for block in model.iter_blocks()
+            if block.end > block.start
+        ]
+
+    def on_textDocument_documentSymbol(self, params):
+        model = self.documents[params["textDocument"]["uri"]]
+        roots = []
+        for chunk in model.chunks:
+            blocks = chunk.index().blocks
+            symbols = [None] * len(blocks)
+            for i, block in enumerate(blocks):
+                if block.kind not in SYMBOL_KINDS:
+                    continue
+
+                start = block.start + chunk.start - 1
+                end = block.end + chunk.start - 1
+                line_text = model.lines[start] if start < len(model.lines) else ""
+                column = max(line_text.find(block.name), 0) if block.name else 0
+                end_text = model.lines[end] if end < len(model.lines) else ""
+                symbols[i] = {
+                    "name": block.name or block.kind,
+                    "kind": SYMBOL_KINDS[block.kind],
+                    "range": {
+                        "start": {"line": start, "character": 0},
+                        "end": {"line": end, "character": len(end_text.rstrip("\r\n"))},
+                    },
+                    "selectionRange": {
+                        "start": {"line": start, "character": column},
+                        "end": {"line": start, "character": column + len(block.name or "")},
+                    },
+                    "children": [],
+                }
+
+                parent = block.parent
+                while parent >= 0 and symbols[parent] is None:
+                    parent = blocks[parent].parent
+
+                (symbols[parent]["children"] if parent >= 0 else roots).append(symbols[i])
+
+        return roots
+
+    def on_pyparse_enclosingBlocks(self, params):
+        #      Breadcrumb chain at a position; each entry carries its end line for "jump to end"."""
+        model = self.documents[params["textDocument"]["uri"]]
+        line = params["position"]["line"] + 1
+        return [
+            {"kind": block.kind, "name": block.name, "startLine": block.start - 1, "endLine": block.end - 1}
+            for block in model.enclosing_blocks(line)
+        ]
+
+
+def main():
+    StructureServer().serve()
+
+
+if __name__ == "__main__":
+    main()
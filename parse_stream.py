@@ -0,0 +1,126 @@
+import os
+import tokenize
+import contextlib
+from typing import Callable, Iterator, Optional, Any
+
+from parse_Python import CompleteStructureCommenter, generate_VFC, VFC_footer
+
+#      A column-0 line starting with one of these continues the previous
+#      top-level statement instead of opening a new one.
+CONTINUATION_KEYWORDS = {"elif", "else", "except", "finally"}
+
+
+def iter_top_level_chunks(readline: Callable[[], str]) -> Iterator[str]:
+    #      Yield the source one top-level statement at a time (comments and blank
+    #      lines ride along with the statement before them). Only the current
+    #      statement's lines are held; tokenize reads the input line by line.
+    lines = []
+    base = 1
+
+    def reader() -> str:
+        line = readline()
+        if line:
+            lines.append(line)
+        return line
+
+    depth = 0
+    at_line_start = True
+    decorator_pending = False
+
+    try:
+        for tok in tokenize.generate_tokens(reader):
+            if tok.type == tokenize.INDENT:
+                depth += 1
+                continue
+
+            if tok.type == tokenize.DEDENT:
+                depth -= 1
+                continue
+
+            if tok.type in (tokenize.NL, tokenize.COMMENT, tokenize.ENDMARKER):
+                continue
+
+            if tok.type == tokenize.NEWLINE:
+                at_line_start = True
+                continue
+
+            if not at_line_start:
+                continue
+
+            at_line_start = False
+            if depth != 0 or tok.start[1] != 0:
+                continue
+
+            if tok.string in CONTINUATION_KEYWORDS:
+                continue
+
+            starts_decorator = tok.string == "@"
+            if not decorator_pending:
+                split = tok.start[0] - base
+                if split > 0:
+                    yield "".join(lines[:split])
+                    del lines[:split]
+                    base = tok.start[0]
+
+            decorator_pending = starts_decorator
+
+    except (tokenize.TokenError, SyntaxError):
+        #      Unbalanced brackets / bad dedent: hand the rest over as one chunk and
+        #      let the AST parse report it.
+        while reader():
+            pass
+
+    if lines:
+        yield "".join(lines)
+
+
+def stream_annotate(
+    input_file: str,
+    output_filename: Optional[str] = None,
+    vfc_filename: Optional[str] = None,
+    echo: Any = None,
+    commenter: Optional[CompleteStructureCommenter] = None,
+) -> int:
+    #      Annotate input_file chunk by chunk, writing annotated text and VFC as it goes.
+    #      Peak memory follows the largest top-level statement, not the file size.
+    #      Returns the number of chunks processed.
+    if commenter is None:
+        commenter = CompleteStructureCommenter()
+
+    if vfc_filename is None:
+        vfc_filename = input_file + ".vfc"
+
+    chunks = 0
+    with contextlib.ExitStack() as stack:
+        src = stack.enter_context(open(input_file, "r", encoding="utf-8"))
+        vfc_out = stack.enter_context(open(vfc_filename, "w", encoding="ascii", errors="ignore"))
+        out = None
+        if output_filename:
+            out = stack.enter_context(open(output_filename, "w", encoding="utf-8"))
+
+        for chunk in iter_top_level_chunks(src.readline):
+            annotated = commenter.add_comments_to_string(chunk)
+            VFC = generate_VFC(annotated)
+
+            if out is not None:
+                if chunks:
+                    out.write("\n")
+                out.write(annotated)
+
+            vfc_out.write(VFC)
+            if echo is not None:
+                echo.write(VFC)
+
+            chunks += 1
+
+        if not chunks:
+            VFC = generate_VFC("")
+            vfc_out.write(VFC)
+            if echo is not None:
+                echo.write(VFC)
+
+        vfc_out.write(VFC_footer(os.path.basename(input_file)))
+        if echo is not None:
+            echo.write("\n")
+
+    return chunks
@@ -0,0 +1,114 @@
+import os
+import re
+import sys
+import shutil
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+from parse_Python import Begins, STRUCT_COMMENT_LINES, scan_line
+from parse_index import iter_python_files
+
+#      Inverse of add_comments: drop the #end... lines and the #begin... tags the
+#      annotator inserted. Lines are scanned with the same string/bracket state the
+#      indentation engine keeps, so marker text inside string literals (including
+#      triple-quoted ones spanning lines) is never touched. Input is processed a line
+#      at a time.
+
+BEGIN_MARKER_RE = re.compile(r" ?#(?:" + "|".join(sorted(Begins, key=len, reverse=True)) + r")(?!\w)")
+
+
+def _strip_begin_markers(line: str, comment: int) -> Tuple[str, int]:
+    #      Remove begin tags (with the space add_comments put before them) from the comment part."""
+    pieces = []
+    last = 0
+    for match in BEGIN_MARKER_RE.finditer(line, max(comment - 1, 0)):
+        if line.index("#", match.start()) < comment:
+            continue
+
+        pieces.append(line[last : match.start()])
+        last = match.end()
+
+    if not pieces:
+        return line, 0
+
+    pieces.append(line[last:])
+    return "".join(pieces), len(pieces) - 1
+
+
+def strip_stream(src: TextIO, out: TextIO) -> Tuple[int, int]:
+    #      Copy src to out without structure markers; returns (end lines dropped, begin tags removed)."""
+    quote = None
+    depth = 0
+    dropped = 0
+    removed = 0
+    for raw in src:
+        line = raw.rstrip("\r\n")
+        ending = raw[len(line) :]
+        if quote is None and line.strip() in STRUCT_COMMENT_LINES:
+            dropped += 1
+            continue
+
+        in_string = quote is not None
+        quote, depth, comment, _ = scan_line(line, quote, depth)
+        if not in_string and comment < len(line) and line[:comment].strip():
+            line, count = _strip_begin_markers(line, comment)
+            removed += count
+
+        out.write(line + ending)
+
+    return dropped, removed
+
+
+def strip_file(path: str) -> Tuple[str, int, int, Optional[str]]:
+    #      Strip path in place (only rewritten when something was removed); returns (path,
+    #      end lines dropped, begin tags removed, error). A file that cannot be read, decoded
+    #      or written is left as it was and gives (path, 0, 0, message)."""
+    tmp = f"{path}.{os.getpid()}.strip"
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as src:
+            with open(tmp, "w", encoding="utf-8", newline="") as out:
+                dropped, removed = strip_stream(src, out)
+
+        if dropped or removed:
+            shutil.copymode(path, tmp)
+            os.replace(tmp, path)
+    except (OSError, UnicodeDecodeError) as exc:
+        return path, 0, 0, f"{type(exc).__name__}: {exc}"
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+    return path, dropped, removed, None
+
+
+def strip_paths(paths: List[str], jobs: Optional[int] = None, log: Any = sys.stderr) -> Dict[str, int]:
+    #      Strip every .py file under paths in place, across worker processes; files that
+    #      fail are reported and counted under "errors" while the rest are still stripped."""
+    files = list(iter_python_files(paths))
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(files)))
+    if jobs == 1:
+        results = [strip_file(path) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(strip_file, files, chunksize=8))
+
+    counts = {"files": len(files), "changed": 0, "lines": 0, "tags": 0, "errors": 0}
+    for path, dropped, removed, error in results:
+        if error is not None:
+            counts["errors"] += 1
+            if log is not None:
+                log.write(f"error: {path}: {error}\n")
+
+            continue
+
+        counts["changed"] += bool(dropped or removed)
+        counts["lines"] += dropped
+        counts["tags"] += removed
+
+    if log is not None:
+        log.write(
+            f"{counts['files']} files, {counts['changed']} stripped:"
+            f" {counts['lines']} end lines and {counts['tags']} begin tags removed, {counts['errors']} errors\n"
+        )
+
+    return counts
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import struct
+import select
+from typing import Dict, Optional, Set, Any
+
+from parse_Python import CompleteStructureCommenter, generate_VFC, write_VFC_file
+from parse_index import skip_dir, walk_tree
+
+#      A burst of save events (editor temp file, rename, chmod) settles well
+#      inside this window; the file is annotated once the directory goes quiet.
+DEBOUNCE_SECONDS = 0.025
+POLL_SECONDS = 0.25
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    #      Linux inotify through ctypes; every directory under root gets a watch."""
+
+    def __init__(self, root: str):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.dirs = {}
+        for dirpath, _ in walk_tree(root):
+            self._watch(dirpath)
+
+    def _watch(self, dirpath: str):
+        wd = self._add_watch(self.fd, os.fsencode(dirpath), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY)
+        if wd >= 0:
+            self.dirs[wd] = dirpath
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        #      Block up to timeout seconds; return the .py paths touched since the last call."""
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(buf[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            dirpath = self.dirs.get(wd)
+            if dirpath is None or not name:
+                continue
+
+            path = os.path.join(dirpath, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not skip_dir(name):
+                    for sub, _ in walk_tree(path):
+                        self._watch(sub)
+
+            elif name.endswith(".py"):
+                changed.add(path)
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    #      Portable fallback: rescan the tree and compare (mtime, size) stamps."""
+
+    def __init__(self, root: str, interval: float = POLL_SECONDS):
+        self.root = root
+        self.interval = interval
+        self.stamps = self._scan()
+
+    def _scan(self) -> Dict[str, tuple]:
+        stamps = {}
+        for dirpath, _ in walk_tree(self.root):
+            try:
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+
+            for entry in entries:
+                if entry.name.endswith(".py") and entry.is_file():
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+
+                    stamps[entry.path] = (st.st_mtime_ns, st.st_size)
+
+        return stamps
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        stamps = self._scan()
+        changed = {path for path, stamp in stamps.items() if self.stamps.get(path) != stamp}
+        self.stamps = stamps
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(root: str, polling: bool = False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+
+    return PollingWatcher(root)
+
+
+def reannotate(path: str, commenter: CompleteStructureCommenter) -> Optional[str]:
+    #      Rebuild the .vfc for path; returns the .vfc path only if its content changed."""
+    try:
+        modified_code = commenter.add_comments(path)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    return write_VFC_file(path, generate_VFC(modified_code), only_if_changed=True)
+
+
+def watch(
+    root: str, polling: bool = False, debounce: float = DEBOUNCE_SECONDS, log: Any = sys.stderr, engine: str = "ast"
+):
+    #      Re-annotate .py files under root as they are saved, until interrupted."""
+    watcher = make_watcher(root, polling)
+    commenter = CompleteStructureCommenter(engine=engine)
+    pending = {}
+
+    if log is not None:
+        log.write(f"watching {os.path.abspath(root)} ({type(watcher).__name__})\n")
+        log.flush()
+
+    try:
+        while True:
+            timeout = debounce if pending else None
+            changed = watcher.wait(timeout)
+            now = time.perf_counter()
+            for path in changed:
+                pending[path] = now
+
+            settled = [path for path, stamp in pending.items() if now - stamp >= debounce]
+            for path in settled:
+                del pending[path]
+                start = time.perf_counter()
+                written = reannotate(path, commenter)
+                if written and log is not None:
+                    log.write(f"{written}  {(time.perf_counter() - start) * 1000:.1f} ms\n")
+                    log.flush()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        watcher.close()
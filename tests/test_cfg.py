@@ -0,0 +1,82 @@
+import os
+import ast
+import sys
+import textwrap
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parse_cfg import EXIT, build_cfg
+
+
+def _graph(source: str):
+    return build_cfg(ast.parse(textwrap.dedent(source)).body[0])
+
+
+def _block_at(graph, line: int) -> int:
+    return next(i for i, (first, last, _) in enumerate(graph.blocks) if first is not None and first <= line <= last)
+
+
+def test_typed_handler_lets_exception_escape():
+    graph = _graph(
+        """
+        def f():
+            try:
+                raise KeyError
+            except ValueError:
+                pass
+        """
+    )
+    raising = _block_at(graph, 4)
+    assert (raising, EXIT, "raise") in graph.edges()
+    assert (raising, _block_at(graph, 5), "exception") in graph.edges()
+
+
+def test_bare_except_catches_everything():
+    graph = _graph(
+        """
+        def f():
+            try:
+                raise KeyError
+            except:
+                pass
+        """
+    )
+    assert (_block_at(graph, 4), EXIT, "raise") not in graph.edges()
+
+
+def test_inner_escape_goes_to_enclosing_handler():
+    graph = _graph(
+        """
+        def f():
+            try:
+                try:
+                    raise KeyError
+                except ValueError:
+                    pass
+            except:
+                pass
+        """
+    )
+    raising = _block_at(graph, 5)
+    assert (raising, _block_at(graph, 8), "exception") in graph.edges()
+    assert (raising, EXIT, "raise") not in graph.edges()
+
+
+def test_escape_runs_through_enclosing_finally():
+    graph = _graph(
+        """
+        def f():
+            try:
+                pass
+            except:
+                try:
+                    g()
+                except ValueError:
+                    pass
+            finally:
+                h()
+        """
+    )
+    final = _block_at(graph, 11)
+    assert (_block_at(graph, 7), final, "raise") in graph.edges()
+    assert (final, EXIT, "raise") in graph.edges()